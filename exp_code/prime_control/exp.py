@@ -13,23 +13,55 @@ import os
 import warnings
 import random
 import string
+import collections
+import queue
+import threading
+import ctypes
+import hashlib
+import tempfile
+import time
+import importlib
+import statistics
+import json
+import io
 import numpy as np
 import psychopy
-from psychopy import visual, monitors, event, data, core, gui
+from psychopy import core
 from psychopy.constants import NOT_STARTED, STARTED, STOPPED
-from psychopy.hardware import keyboard
-# this may be different in windows
+# this may be different in windows. Feedback tones are scheduled with psychtoolbox (ptb), pygame is the fallback
 from psychopy import prefs
-prefs.hardware['audioLib'] = ['pygame']
-from psychopy import sound
-import psychtoolbox as ptb
-import copy
+prefs.hardware['audioLib'] = ['ptb', 'pygame']
+import csv
 
 # Set psychopy version
 psychopyVersion = '2023.1.3'
 psychopy.useVersion(psychopyVersion)
 print(f'Using psychopy version {psychopy.__version__}')
 
+
+class _lazyModule:
+    # Module that is imported the first time one of its attributes is used
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+# Window, input, data and audio modules (and their backends) load when they are first used, so checks,
+# simulations and analysis helpers that import exp start without them
+visual = _lazyModule('psychopy.visual')
+monitors = _lazyModule('psychopy.monitors')
+event = _lazyModule('psychopy.event')
+data = _lazyModule('psychopy.data')
+gui = _lazyModule('psychopy.gui')
+sound = _lazyModule('psychopy.sound')
+keyboard = _lazyModule('psychopy.hardware.keyboard')
+ptb = _lazyModule('psychtoolbox')
+
 # Ensure that relative paths start from the same directory as this script
 _thisDir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(_thisDir)
@@ -67,23 +99,34 @@ class exp:
         self._blocks_to_run = None
         self._block_trials = None
         self._block_task = None
+        # limits to the order of the trials in a block (see constrainedShuffler), None to shuffle freely
+        self._shuffler = self.constrainedShuffler(max_runs={'SOA': 3, 'congruent': 4, 'stim_position': 4})
         self.trials_in_block = None
         self._block_running = None
 
         # for trial settings
         self._trial_feedback = True
+        self._feedback_sounds = None
+        self._correct_tone = None # e.g. 'C' to play a tone on correct trials
 
         # for current trial
         self._this_trial_correct_response = None
+        self._this_trial_mask_correct_response = None
+        self._this_trial_prime_correct_response = None
         self._this_trial_accuracy = None
         self._this_trial_answer = None
         self._this_trial_rt = None
         self._this_trial_task = None
+        self._this_trial_soa = None
+        self._this_trial_congruent = None
+        self._this_trial_prime_presence = None
         self._print_answer_info = None
 
         # for monitor
         self._win = None
         self._flip_it = None
+        # for frame recording (_record_flips)
+        self._recorder = None
         self._frame_rate = None
 
         # for stimuli timing
@@ -92,6 +135,15 @@ class exp:
         self._soa_duration_f = None
         self._mask_duration_f = None
         self._soa_f = None
+        self._frame_schedules = {}
+        self._measured_frame_rate = None
+        self._timing_plan = None
+
+        # for frame timing checks. Flip times of the current trial are recorded in a preallocated buffer
+        self._frame_times = np.zeros(1024)
+        self._frame_tolerance = .5 # fraction of a frame
+        self._requeue_timing_errors = True
+        self.trial_timing_error = False
 
         # for performance
         self._prime_correct_count = None
@@ -99,6 +151,8 @@ class exp:
         self._mask_correct_count = None
         self._mask_trial_count  = None
         self._mask_rt = None
+        self._trial_stats = self.trialStatistics()
+        self._priming_monitor = self.primingMonitor()
 
         # for staircase
         self._stairs = None
@@ -118,32 +172,65 @@ class exp:
         self._default_text_height = .7
         self._default_wrap_width = 35
 
+        # for text cache. Static messages are created when the window opens
+        self._text_cache = collections.OrderedDict()
+        self._text_cache_size = 64
+        self._static_messages = {'too_slow': dict(text='Too slow!\nPress A or L to continue to the next trial.', color='red',
+                                                 pos=[0,0], height=self._default_text_height),
+                                 'continue': dict(text='Press A or L when you are ready to continue.', color='black',
+                                                  height=self._default_text_height*.8, wrapWidth=15),
+                                 'incorrect': dict(text='INCORRECT', color='red', pos=[0,1], height=self._default_text_height),
+                                 'prime_detection': dict(text='Was the prime present?\n\n  ABSENT               PRESENT',
+                                                         height=self._default_text_height, wrapWidth=25, pos=[0, 0.8],
+                                                         color='black')}
+
         # for stim contrast (this is only used during the instructions)
         self._prime_contrast = 1
         self._mask_contrast = 1
 
+        # for stimuli cache (built after opening the window)
+        self._stim_cache = None
+
+        # for headless mode
+        self._headless = False
+        self._virtual_time = None
+        self._exp_clock = exp_clock
+
         # others
         self.simulate_answers = None
         self._force_correct = None
         self._log_instructions = None
         self._log_file_name = None
+        self._progress_log = None
+        self._trial_stream = None
         self._forced_break_recurrence = 4
         self._forced_break_duration = 180 # 3 minutes
+        self._save_timeout = 30 # seconds per destination
+        self._save_retries = 3
     
-        # for key capturing
-        self.kb = keyboard.Keyboard()
+        # for key capturing. The keyboard is created when it is first used (kb)
+        self._keyboard = None
         self._key_left = 'a'
         self._key_right = 'l'
+        self._input_poll_interval = .002
+        # for background response collection
+        self._threaded_responses = True
+        self._response_collector = None
 
         # for key simulation
         if self.simulate_answers:
             self.waitKeys = self._simulate_wait_keys
             self.getKeys = self._simulate_get_keys
         else:
-            self.waitKeys = self.kb.waitKeys
-            self.getKeys = self.kb.getKeys
+            self.waitKeys = self._keyboard_wait_keys
+            self.getKeys = self._keyboard_get_keys
         self._rt_mean_simulated = 0.7
         self._rt_sd_simulated = 0.1
+        self._simulated_answer_keys = {'left': self._key_left, 'right': self._key_right,
+                                       'absent': self._key_left, 'present': self._key_right}
+        # for simulated observer
+        self._observer = None
+        self._simulated_response = None
 
     def start_exp_handler(self, exp_info=None):
         """
@@ -211,17 +298,83 @@ class exp:
         
         # set up progress file
         self.setup_progress_log()
+        # set up trial stream
+        self.setup_trial_stream()
 
     def update_timing(self):
         """
-        Convert default timing values (ms) to frames using the frame rate of the experiment.
+        Convert default timing values (s) to the closest number of frames using the frame rate of the experiment.
 
         :return: None
         """       
-        self._fixation_duration_f = int(self._fixation_duration_s * self._frame_rate)
-        self._prime_duration_f = int(self._default_prime_duration_s * self._frame_rate)
-        self._mask_duration_f = int(self._default_mask_duration_s * self._frame_rate)
+        self._fixation_duration_f = self._to_frames(self._fixation_duration_s)
+        self._prime_duration_f = self._to_frames(self._default_prime_duration_s)
+        self._mask_duration_f = self._to_frames(self._default_mask_duration_s)
+
 
+    def _to_frames(self, seconds):
+        # Closest number of frames to a duration in seconds. Works with single values and arrays
+        frames = np.rint(np.asarray(seconds, dtype=float) * self._frame_rate).astype(int)
+        return int(frames) if frames.ndim == 0 else frames
+
+    def calibrate_refresh(self, n_flips=300, tolerance=.001, rate_tolerance=.005, strict=True):
+        """
+        Measure the refresh interval of the monitor and check that the fixation, prime and mask durations and
+        every SOA can be shown at the measured rate. Run it after opening the window.
+
+        :param n_flips: Optional. Number of flips used to measure the refresh interval (default: 300).
+        :param tolerance: Optional. Maximum difference (s) between a requested and an achieved duration (default: 1 ms).
+        :param rate_tolerance: Optional. Extra difference allowed per second of duration (default: .005), so the
+                               normal spread of the measured refresh rate doesn't fail long durations (fixation).
+        :param strict: Optional. If True (default), refuse to start (RuntimeError) when a duration can't be achieved.
+                       If False, the frame rate is set to the measured one and the errors are only warned
+                       (e.g. for debugging on a 60 Hz monitor).
+
+        :return: Dictionary with the requested duration (s), frames and achieved duration (s) of every interval.
+        """
+        # Measure refresh interval, the first flips are skipped because they are usually irregular
+        flip_times = np.zeros(n_flips)
+        for i in range(n_flips):
+            flip_times[i] = self._flip_it()
+        measured_interval = float(np.median(np.diff(flip_times[10:])))
+        self._measured_frame_rate = 1 / measured_interval
+        self._experiment_info['measured_frame_rate'] = round(self._measured_frame_rate, 3)
+
+        # Debugging: use the monitor frame rate
+        if not strict:
+            self._frame_rate = int(round(self._measured_frame_rate))
+            self._experiment_info['frame_rate'] = self._frame_rate
+
+        # Quantize all the durations at once
+        names = ['fixation', 'prime', 'mask'] + [f'soa_{x}' for x in self._possible_SOAs_s]
+        requested = np.array([self._fixation_duration_s, self._default_prime_duration_s,
+                              self._default_mask_duration_s] + list(self._possible_SOAs_s))
+        frames = self._to_frames(requested)
+        achieved = frames * measured_interval
+        error = achieved - requested
+        failed = (np.abs(error) > tolerance + rate_tolerance * requested) | (frames < 1)
+
+        # Report
+        print('\n########################################',
+              f'Frame rate: {self._frame_rate} Hz (measured: {self._measured_frame_rate:.3f} Hz)\n',
+              *[f'{name:>12}: {r * 1000:7.2f} ms -> {f:4d} frames = {a * 1000:7.2f} ms ({e * 1000:+.2f})'
+                f'{" !" if x else ""}'
+                for name, r, f, a, e, x in zip(names, requested, frames, achieved, error, failed)],
+              '########################################\n', sep='\n')
+
+        if failed.any():
+            message = (f'Timing can\'t be achieved at {self._measured_frame_rate:.3f} Hz: '
+                       f'{", ".join(np.array(names)[failed])}. Check the frame rate of the monitor.')
+            if strict:
+                raise RuntimeError(message)
+            warnings.warn(message)
+
+        # Apply timing
+        self.update_timing()
+        self._timing_plan = {name: {'requested': float(r), 'frames': int(f), 'achieved': float(a)}
+                             for name, r, f, a in zip(names, requested, frames, achieved)}
+
+        return self._timing_plan
 
     def open_window(self, monitor=None, full_screen=False, screen_index=0, size=None, background_color='white'):
         """
@@ -247,6 +400,15 @@ class exp:
         class InvalidMonitorType(Exception):
             pass
 
+        # Headless mode doesn't open a real window
+        if self._headless:
+            self._win = self.headlessWindow(self._virtual_time, self._frame_rate)
+            self._flip_it = self._win.flip
+            self._record_frames = False
+            self.build_stim_cache()
+            self.prerender_messages()
+            return
+
         # Default size for debugging
         if size is None:
             size = [900, 800]
@@ -284,7 +446,17 @@ class exp:
         self._mouse.setVisible(False)
         self._mouse.setExclusive(True)
 
+        # Build trial stimuli once so present_stimuli doesn't create them on every trial
+        self.build_stim_cache()
+        # Create the messages shown during the blocks
+        self.prerender_messages()
+        # Load feedback tones
+        self.setup_feedback_sounds()
+
     def close_win(self):
+        # Finish the recording before the window (and its buffers) is gone
+        if self._recorder is not None:
+            self._record_flips(False)
         self._win.close()
 
     class timeTracker:
@@ -292,7 +464,7 @@ class exp:
             self.first_frame = None
             self.response_prompt = None
 
-    def show_message(self, wait_keypress: list = None, max_wait=float('inf'), return_text=False, block_keypress=None, **kwargs):
+    def show_message(self, wait_keypress: list = None, max_wait=float('inf'), return_text=False, block_keypress=None, cache=True, **kwargs):
         """
         Displays a message on the screen using the psychopy TextStim class and waits for a keypress if specified.
 
@@ -302,6 +474,9 @@ class exp:
 
         :param return_text: Optional. If True, the function returns the TextStim object instead of drawing it on the screen.
 
+        :param cache: Optional. If True (default), the TextStim is taken from the text cache. Use False if the text or
+                      position of the returned TextStim is changed.
+
         :param kwargs: Additional keyword arguments that can be passed to the `visual.TextStim` class constructor.
                    These arguments control the properties of the text stimulus, such as text content, font, color, etc.
                    Refer to the documentation of `visual.TextStim` for more details.
@@ -315,8 +490,8 @@ class exp:
         if block_keypress is None:
             block_keypress = 0.2
 
-        # Create a TextStim using the **kwargs dictionary
-        text_stim = visual.TextStim(self._win, **kwargs)
+        # Get a TextStim using the **kwargs dictionary
+        text_stim = self.get_text_stim(cache=cache, **kwargs)
 
         # Log instructions if enabled
         if self._log_instructions:
@@ -338,22 +513,93 @@ class exp:
             # draw text
             text_stim.draw()
             self._flip_it()
-            core.wait(block_keypress)
 
         # If list of keys provided, wait for keys, otherwise text is shown until next win flip
-        if isinstance(wait_keypress, list):
-            if len(wait_keypress):
-                # In Windows a key press before the waitKeys function is called is registered
-                # and ends the routine immediately. This is most likely a bug as clearing key
-                # presses using the keyboard module or the event module does not work. This is
-                # a workaround that stops the code until no key press is registered 
-                while True:
-                    keys = self.kb.getKeys(keyList=wait_keypress)
-                    if not keys:
-                        break
-                # Wait for key press
-                self.waitKeys(keyList=wait_keypress, maxWait=max_wait)
-                self._flip_it()
+        if isinstance(wait_keypress, list) and len(wait_keypress):
+            # Key presses before the message or during block_keypress don't count
+            self.wait_for_keys(wait_keypress, max_wait=max_wait, block_keypress=block_keypress)
+            self._flip_it()
+        else:
+            self._wait(block_keypress)
+
+    def wait_for_keys(self, key_list, max_wait=float('inf'), block_keypress=0, reset_clock=True, flush=True):
+        """
+        Input gate for messages and questions. Key presses made before the gate opens (or during block_keypress)
+        are flushed, then the keyboard is checked every few milliseconds, sleeping in between, until one of the
+        keys is pressed.
+
+        :param key_list: Keys to wait for.
+        :param max_wait: Optional. Maximum time (s) to wait for a key press.
+        :param block_keypress: Optional. Time (s) during which key presses are ignored.
+        :param reset_clock: Optional. If True (default), RTs are measured from the moment the gate opens.
+                            Use False when the keyboard clock was reset on the flip of the screen.
+        :param flush: Optional. If True (default), key presses made before the gate opens are discarded. Use False
+                      for consecutive calls while typing, so keys pressed in between aren't lost.
+
+        :return: List of key presses, or None if max_wait passed without a key press.
+        """
+        # Ignore key presses for a while
+        if block_keypress:
+            self._wait(block_keypress)
+
+        # Simulated answers
+        if self.simulate_answers:
+            return self.waitKeys(keyList=key_list, maxWait=max_wait)
+
+        # Flush presses made before the gate opened. In Windows clearEvents alone doesn't always remove them,
+        # so the pending keys are also read and discarded
+        if flush:
+            self.kb.clearEvents(eventType='keyboard')
+            self.kb.getKeys()
+        if reset_clock:
+            self.kb.clock.reset()
+
+        # Wait for keys
+        wait_clock = self._new_clock()
+        while wait_clock.getTime() < max_wait:
+            keys = self.kb.getKeys(keyList=key_list)
+            if keys:
+                return keys
+            time.sleep(self._input_poll_interval)
+        return None
+
+    @staticmethod
+    def _text_cache_key(**kwargs):
+        # Hashable key with all the TextStim settings (text, height, wrapWidth, color, pos, ...)
+        return tuple(sorted((name, tuple(value) if isinstance(value, (list, tuple, np.ndarray)) else value)
+                            for name, value in kwargs.items()))
+
+    def get_text_stim(self, cache=True, **kwargs):
+        """
+        Get a TextStim with the given settings from the text cache. The stimulus is created (and its text laid
+        out) only the first time, and the least recently used stimuli are removed when the cache is full.
+
+        :param cache: Optional. If False, a new TextStim is created and not cached. Use it for stimuli whose
+                      text or position is changed after they are created.
+        :param kwargs: Arguments of visual.TextStim.
+
+        :return: TextStim.
+        """
+        if not cache:
+            return self._text_stim(**kwargs)
+
+        key = self._text_cache_key(**kwargs)
+        text_stim = self._text_cache.get(key)
+        if text_stim is None:
+            text_stim = self._text_stim(**kwargs)
+            self._text_cache[key] = text_stim
+            # Remove least recently used
+            if len(self._text_cache) > self._text_cache_size:
+                self._text_cache.popitem(last=False)
+        else:
+            self._text_cache.move_to_end(key)
+        return text_stim
+
+    def prerender_messages(self):
+        # Create the messages shown during the blocks (e.g. after an aborted trial) when the window opens
+        self._text_cache.clear()
+        for kwargs in self._static_messages.values():
+            self.get_text_stim(**kwargs)
 
     def reset_block(self):
         # Set block count to -1 if None
@@ -366,32 +612,45 @@ class exp:
         self._prime_trial_count = 0
         self._mask_correct_count = 0
         self._mask_trial_count = 0
-        self._mask_rt = []
-        # Shuffle trial list
-        np.random.shuffle(self._block_trials_mask)
-        np.random.shuffle(self._block_trials_prime)
+        self._mask_rt = self.runningStats()
+        # Shuffle trial tables
+        self._block_trials_mask.shuffle(self._shuffler)
+        self._block_trials_prime.shuffle(self._shuffler)
 
-    def _simulate_wait_keys(self, maxWait=None, keyList=None, modifiers=None, timeStamped=False, clear=None):
+    def _simulate_answer(self, keyList, judgement, correct_response, caller):
+        """
+        Choose the key and RT of a simulated answer. The simulated observer is used if one is set and the
+        answer is a left/right (or absent/present) judgement, otherwise the key is random (or forced correct)
+        and the RT is drawn from a Gaussian.
+
+        :return: Tuple with the key name and the RT (s).
+        """
 
-        # Get force correct value
-        force_correct = self._force_correct
+        # Use the simulated observer
+        correct_key = self._simulated_answer_keys.get(correct_response)
+        if self._observer is not None and correct_key is not None and \
+                keyList is not None and {self._key_left, self._key_right} <= set(keyList):
+            is_correct, rt = self._observer.sample(judgement, self._this_trial_soa, self._this_trial_congruent,
+                                                   self._this_trial_prime_presence)
+            if is_correct:
+                name = correct_key
+            else:
+                name = self._key_right if correct_key == self._key_left else self._key_left
+            return name, float(rt)
 
         # Sample a number that on average is 0.4 and is never lower than 0
         rt = max(random.gauss(self._rt_mean_simulated, self._rt_sd_simulated), 0)
         
         # If force correct return correct key
-        if force_correct:
-            if self._this_trial_correct_response is None:
-                warnings.warn('_simulate_wait_keys: Cannot force correct if correct response is None')
+        if self._force_correct:
+            if correct_response is None:
+                warnings.warn(f'{caller}: Cannot force correct if correct response is None')
                 if keyList is None:
                     name = random.choice(string.ascii_letters)
                 else:
                     name = random.choice(keyList)
             else:
-                if self._this_trial_correct_response == 'left':
-                    name = self._key_left
-                elif self._this_trial_correct_response == 'right':
-                    name = self._key_right
+                name = self._simulated_answer_keys[correct_response]
         else:
             # Randomly pick an element of keyList, or a letter if keyList is None
             if keyList is None:
@@ -399,13 +658,26 @@ class exp:
             else:
                 name = random.choice(keyList)
 
+        return name, rt
+
+    def _simulate_wait_keys(self, maxWait=None, keyList=None, modifiers=None, timeStamped=False, clear=None):
+
+        # Get simulated answer. waitKeys collects the prime answer: detection in mask trials
+        # and discrimination in prime trials
+        if self._this_trial_task == 'mask':
+            judgement = 'prime_detection'
+        else:
+            judgement = 'prime_discrimination'
+        name, rt = self._simulate_answer(keyList, judgement, self._this_trial_prime_correct_response, '_simulate_wait_keys')
+        self._simulated_response = None
+
         # Check if maxWait is not None and if rt is greater than maxWait
         if maxWait is not None and rt > maxWait:
             # If so, return None
             return None
 
-        # Use psychopy.core.wait() to wait for rt seconds
-        core.wait(rt)
+        # Wait for rt seconds (virtual time in headless mode)
+        self._wait(rt)
 
         # Create a list with a single element, which is a list containing the name and rt variables
         response = self.custom_KeyPress(name, rt)
@@ -415,37 +687,22 @@ class exp:
 
     def _simulate_get_keys(self, keyList=None, waitRelease=True, clear=True):
         
-        # Get force correct value
-        force_correct = self._force_correct
-
-        # Sample a number that on average is 0.4 and is never lower than 0
-        rt = max(random.gauss(self._rt_mean_simulated, self._rt_sd_simulated), 0)
-        
-        # If force correct return correct key
-        if force_correct:
-            if self._this_trial_correct_response is None:
-                warnings.warn('_simulate_get_keys: Cannot force correct if correct response is None')
-                if keyList is None:
-                    name = random.choice(string.ascii_letters)
-                else:
-                    name = random.choice(keyList)
-            else:
-                if self._this_trial_correct_response == 'left':
-                    name = self._key_left
-                elif self._this_trial_correct_response == 'right':
-                    name = self._key_right
+        # Get simulated answer. getKeys collects the mask answer. Observer answers are sampled
+        # once per response window, so the RT doesn't change between frames
+        judgement = 'mask_discrimination'
+        if self._observer is not None and self._simulated_response is None:
+            self._simulated_response = self._simulate_answer(keyList, judgement, self._this_trial_mask_correct_response, '_simulate_get_keys')
+        if self._simulated_response is not None:
+            name, rt = self._simulated_response
         else:
-            # Randomly pick an element of keyList, or a letter if keyList is None
-            if keyList is None:
-                name = random.choice(string.ascii_letters)
-            else:
-                name = random.choice(keyList)
+            name, rt = self._simulate_answer(keyList, judgement, self._this_trial_mask_correct_response, '_simulate_get_keys')
 
         # Create a list with a single element, which is a list containing the name and rt variables
         response = self.custom_KeyPress(name, rt)
 
         # if rt is greater than time passed since keyboard reset, return response   
         if self.kb.clock.getTime() > rt:
+            self._simulated_response = None
             # Return the response list
             return [response]
         # otherwise return an empty list
@@ -457,18 +714,498 @@ class exp:
             self.name = name
             self.rt = rt
 
+    class simulatedObserver:
+
+        def __init__(self, accuracy: float = .5, rt_mean: float = .7, rt_sd: float = .1, rng=None):
+            """
+            Simulated participant used to generate answers when keys are simulated. The base observer answers
+            correctly with a fixed probability and draws RTs from a single Gaussian, like the default simulated
+            answers. Other observers override p_correct and rt_mean to make the answers depend on the trial.
+
+            All methods take numpy arrays (or scalars) of trial parameters, so the answers of a whole block can
+            be sampled in a single call.
+
+            :param accuracy: Probability of a correct answer.
+            :param rt_mean: Mean RT (s).
+            :param rt_sd: RT standard deviation (s).
+            :param rng: Optional. numpy random generator. The global numpy generator is used if None.
+            """
+            self.accuracy = accuracy
+            self.rt_mean_s = rt_mean
+            self.rt_sd_s = rt_sd
+            self.rng = np.random if rng is None else rng
+
+        def p_correct(self, judgement, soa, congruent, prime_presence):
+            """
+            Probability of a correct answer.
+
+            :param judgement: 'prime_discrimination', 'prime_detection' or 'mask_discrimination'.
+            :param soa: SOA (s).
+            :param congruent: Whether prime and mask point in the same direction.
+            :param prime_presence: 'present' or 'absent'.
+            """
+            return np.full(np.shape(soa), self.accuracy, dtype=float)
+
+        def rt_mean(self, judgement, soa, congruent, prime_presence):
+            # Mean RT (s), same parameters as p_correct
+            return np.full(np.shape(soa), self.rt_mean_s, dtype=float)
+
+        def rt_sd(self, judgement, soa, congruent, prime_presence):
+            # RT standard deviation (s), same parameters as p_correct
+            return np.full(np.shape(soa), self.rt_sd_s, dtype=float)
+
+        def sample(self, judgement, soa, congruent, prime_presence='present'):
+            """
+            Sample answers for one or more trials.
+
+            :return: Tuple with a boolean array (answer is correct) and an array of RTs (s). RTs are never
+                     lower than 0.
+            """
+            # Make all parameters arrays of the same shape
+            judgement, soa, congruent, prime_presence = np.broadcast_arrays(
+                np.asarray(judgement), np.asarray(soa, dtype=float), np.asarray(congruent, dtype=bool),
+                np.asarray(prime_presence))
+
+            # Sample accuracy and rt
+            is_correct = self.rng.random(soa.shape) < self.p_correct(judgement, soa, congruent, prime_presence)
+            rt = self.rng.normal(self.rt_mean(judgement, soa, congruent, prime_presence),
+                                 self.rt_sd(judgement, soa, congruent, prime_presence))
+
+            return is_correct, np.maximum(rt, 0)
+
+    class psychometricObserver(simulatedObserver):
+
+        def __init__(self, threshold: float = .04, slope: float = 150, lapse: float = .02,
+                     false_alarm_rate: float = .1, mask_accuracy: float = .95, prime_rt_mean: float = .6,
+                     mask_rt_mean: float = .38, rt_sd: float = .08, rng=None):
+            """
+            Observer whose prime visibility follows a logistic psychometric function of the SOA. Prime
+            discrimination goes from chance (.5) to 1 - lapse and prime detection goes from the false alarm
+            rate to 1 - lapse. Absent primes are correctly rejected with probability 1 - false_alarm_rate. Mask
+            discrimination has a fixed accuracy.
+
+            :param threshold: SOA (s) at which the prime is half visible.
+            :param slope: Slope of the logistic function (1/s).
+            :param lapse: Lapse rate.
+            :param false_alarm_rate: Probability of reporting an absent prime as present.
+            :param mask_accuracy: Accuracy in mask discrimination.
+            :param prime_rt_mean: Mean RT (s) of prime judgements.
+            :param mask_rt_mean: Mean RT (s) of mask discrimination.
+            :param rt_sd: RT standard deviation (s).
+            :param rng: Optional. numpy random generator. The global numpy generator is used if None.
+            """
+            super().__init__(accuracy=mask_accuracy, rt_mean=mask_rt_mean, rt_sd=rt_sd, rng=rng)
+            self.threshold = threshold
+            self.slope = slope
+            self.lapse = lapse
+            self.false_alarm_rate = false_alarm_rate
+            self.prime_rt_mean = prime_rt_mean
+
+        def visibility(self, soa):
+            # Logistic psychometric function of the SOA
+            return 1 / (1 + np.exp(-self.slope * (np.asarray(soa, dtype=float) - self.threshold)))
+
+        def p_correct(self, judgement, soa, congruent, prime_presence):
+            visibility = self.visibility(soa)
+            # prime discrimination goes from chance to 1 - lapse
+            discrimination = .5 + (.5 - self.lapse) * visibility
+            # prime detection, absent primes are correct rejections
+            hit = self.false_alarm_rate + (1 - self.false_alarm_rate - self.lapse) * visibility
+            detection = np.where(prime_presence == 'absent', 1 - self.false_alarm_rate, hit)
+
+            return np.select([judgement == 'prime_discrimination', judgement == 'prime_detection'],
+                             [discrimination, detection], default=self.accuracy)
+
+        def rt_mean(self, judgement, soa, congruent, prime_presence):
+            return np.where(judgement == 'mask_discrimination', self.rt_mean_s, self.prime_rt_mean)
+
+    class primingObserver(psychometricObserver):
+
+        def __init__(self, priming_effect_slope: float = 1, max_priming_effect: float = .1,
+                     incongruent_mask_accuracy: float = .9, **kwargs):
+            """
+            Psychometric observer with response priming in mask discrimination. Congruent primes speed up and
+            incongruent primes slow down the mask RT by half the priming effect, which increases linearly with
+            the SOA (Vorberg et al., 2003). Incongruent primes also lower the mask accuracy. The priming effect
+            does not depend on prime visibility.
+
+            :param priming_effect_slope: Priming effect (s) per second of SOA.
+            :param max_priming_effect: Largest priming effect (s).
+            :param incongruent_mask_accuracy: Mask accuracy in incongruent trials.
+            :param kwargs: Arguments for psychometricObserver.
+            """
+            super().__init__(**kwargs)
+            self.priming_effect_slope = priming_effect_slope
+            self.max_priming_effect = max_priming_effect
+            self.incongruent_mask_accuracy = incongruent_mask_accuracy
+
+        def priming_effect(self, soa, prime_presence):
+            # Incongruent minus congruent mask RT (s). There is no priming without prime
+            effect = np.minimum(self.priming_effect_slope * np.asarray(soa, dtype=float), self.max_priming_effect)
+            return np.where(prime_presence == 'absent', 0, effect)
+
+        def p_correct(self, judgement, soa, congruent, prime_presence):
+            p = super().p_correct(judgement, soa, congruent, prime_presence)
+            incongruent_mask = (judgement == 'mask_discrimination') & ~congruent & (prime_presence != 'absent')
+            return np.where(incongruent_mask, self.incongruent_mask_accuracy, p)
+
+        def rt_mean(self, judgement, soa, congruent, prime_presence):
+            rt = super().rt_mean(judgement, soa, congruent, prime_presence)
+            shift = np.where(congruent, -.5, .5) * self.priming_effect(soa, prime_presence)
+            return np.where(judgement == 'mask_discrimination', rt + shift, rt)
+
+    def _set_observer(self, observer):
+        # Set the simulated observer used for simulated answers. None goes back to random answers
+        self._observer = observer
+
+    class responseCollector:
+        def __init__(self, kb, keys, poll_interval=.0005):
+            """
+            Collects the response of a trial in a background thread, so the frame loop only reads the response
+            and escape attributes. As with getKeys, a response is only complete when the key is released, but
+            its RT comes from the key press timestamp, relative to the flip on which open is called. Escape is
+            taken on key press.
+
+            :param kb: psychopy.hardware.keyboard.Keyboard.
+            :param keys: Response keys. Escape is always collected.
+            :param poll_interval: Optional. Time (s) between keyboard polls.
+            """
+            self._kb = kb
+            self._keys = list(keys)
+            self._poll_interval = poll_interval
+            # The thread only polls while a trial is running
+            self._active = threading.Event()
+            # Held while polling, so stop waits for the last poll before the main thread uses the keyboard
+            self._polling = threading.Lock()
+            self._onset = None
+            # Set by the thread, read by the frame loop
+            self.response = None
+            self.escape = False
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+        def _run(self):
+            while True:
+                self._active.wait()
+                with self._polling:
+                    if self._active.is_set():
+                        if self._kb.getKeys(keyList=['escape'], waitRelease=False, clear=True):
+                            self.escape = True
+                        # response keys are only returned once released, so trials end on release
+                        for key in self._kb.getKeys(keyList=self._keys, waitRelease=True, clear=True):
+                            # keys pressed before the response window opened are discarded
+                            if self.response is None and self._onset is not None and key.tDown >= self._onset:
+                                self.response = exp.custom_KeyPress(key.name, key.tDown - self._onset)
+                time.sleep(self._poll_interval)
+
+        def start(self):
+            # Start collecting for a new trial, the response window is still closed
+            self._onset = None
+            self.response = None
+            self.escape = False
+            self._active.set()
+
+        def open(self):
+            # Open the response window. Called with callOnFlip, so RTs are measured from that flip
+            self._kb.clock.reset()
+            self._onset = self._kb.clock.getLastResetTime()
+
+        def stop(self):
+            # Stop polling and wait for the last poll to finish
+            self._active.clear()
+            with self._polling:
+                pass
+
+    def _get_response_collector(self):
+        # Background response collection is only used with a real keyboard (simulated answers are polled)
+        if self.simulate_answers or self._headless or not self._threaded_responses:
+            return None
+        if self._response_collector is None:
+            self._response_collector = self.responseCollector(self.kb, [self._key_left, self._key_right])
+        return self._response_collector
+
+    @property
+    def kb(self):
+        # Keyboard, created the first time it is used
+        if self._keyboard is None:
+            self._keyboard = keyboard.Keyboard()
+        return self._keyboard
+
+    @kb.setter
+    def kb(self, kb):
+        self._keyboard = kb
+
+    def _keyboard_wait_keys(self, *args, **kwargs):
+        return self.kb.waitKeys(*args, **kwargs)
+
+    def _keyboard_get_keys(self, *args, **kwargs):
+        return self.kb.getKeys(*args, **kwargs)
+
     def _simulate_keys(self, simulate):
-        # Set answer function
-        if simulate:
+        # Set answer function. There is no keyboard in headless mode, so answers are always simulated
+        self.simulate_answers = simulate or self._headless
+        if self.simulate_answers:
             self.waitKeys = self._simulate_wait_keys
             self.getKeys = self._simulate_get_keys
         else:
-            self.waitKeys = self.kb.waitKeys
-            self.getKeys = self.kb.getKeys
+            self.waitKeys = self._keyboard_wait_keys
+            self.getKeys = self._keyboard_get_keys
+
+    class virtualTime:
+        # Time source shared by all the virtual clocks. Time only moves when advance is called.
+        def __init__(self):
+            self.now = 0.0
+
+        def advance(self, secs):
+            self.now += max(secs, 0)
+
+    class virtualClock:
+        # Stand-in for core.Clock that reads the time from a virtualTime
+        def __init__(self, virtual_time):
+            self._virtual_time = virtual_time
+            self._time_at_reset = virtual_time.now
+
+        def getTime(self):
+            return self._virtual_time.now - self._time_at_reset
+
+        def reset(self, newT=0.0):
+            self._time_at_reset = self._virtual_time.now - newT
+
+    class headlessWindow:
+        def __init__(self, virtual_time, frame_rate):
+            """
+            Stand-in for visual.Window used in headless mode. Every flip advances the virtual time by one
+            frame, then runs the functions scheduled with callOnFlip and timeOnFlip in the order they
+            were scheduled.
+
+            :param virtual_time: exp.virtualTime shared with the experiment clocks.
+            :param frame_rate: Frame rate (Hz) of the simulated monitor.
+            """
+            self._virtual_time = virtual_time
+            self.frame_interval = 1 / frame_rate
+            self.mouseVisible = False
+            # Functions to run on the next flip
+            self._to_call = []
+            # Flip recording
+            self.flip_count = 0
+            self.last_flip_time = None
+
+        def flip(self, clearBuffer=True):
+            # advance one frame
+            self._virtual_time.advance(self.frame_interval)
+            self.flip_count += 1
+            self.last_flip_time = self._virtual_time.now
+            # run scheduled functions
+            to_call, self._to_call = self._to_call, []
+            for function, args, kwargs in to_call:
+                function(*args, **kwargs)
+            return self.last_flip_time
+
+        def callOnFlip(self, function, *args, **kwargs):
+            self._to_call.append((function, args, kwargs))
+
+        def timeOnFlip(self, obj, attrib):
+            self.callOnFlip(self._assign_flip_time, obj, attrib)
+
+        def _assign_flip_time(self, obj, attrib):
+            if isinstance(obj, dict):
+                obj[attrib] = self.last_flip_time
+            else:
+                setattr(obj, attrib, self.last_flip_time)
+
+        def getMovieFrame(self, buffer='front'):
+            pass
+
+        def close(self):
+            pass
+
+    class headlessStim:
+        def __init__(self, name=None, text=None, pos=(0, 0), opacity=1, color=None, **kwargs):
+            """
+            Stand-in for visual.ShapeStim and visual.TextStim used in headless mode. It keeps the attributes
+            that the experiment reads or sets but it never draws anything.
+            """
+            self.name = name
+            self.text = text
+            self.pos = pos
+            self.opacity = opacity
+            self.color = color
+            self.autoDraw = False
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+
+        def setAutoDraw(self, value, log=None):
+            self.autoDraw = value
+
+        def setColor(self, color, colorSpace=None, operation='', log=None):
+            self.color = color
+
+        def setPos(self, newPos, operation='', log=None):
+            self.pos = newPos
+
+        def setText(self, text=None, log=None):
+            self.text = text
+
+        def setOpacity(self, newOpacity, operation='', log=None):
+            self.opacity = newOpacity
+
+        def draw(self, win=None):
+            pass
+
+    class headlessKeyboard:
+        # Stand-in for keyboard.Keyboard used in headless mode. The clock is used by the simulated answers
+        def __init__(self, virtual_time):
+            self.clock = exp.virtualClock(virtual_time)
+
+        def clearEvents(self, eventType=None):
+            pass
+
+        def getKeys(self, keyList=None, waitRelease=True, clear=True):
+            return []
+
+        def waitKeys(self, maxWait=float('inf'), keyList=None, waitRelease=True, clear=True):
+            return []
+
+    def _set_headless(self, headless=True):
+        """
+        Run the experiment without a window, keyboard or sound. Flips, waits and clocks use a virtual clock
+        that advances one frame per flip (and by the waited time on each wait) instead of sleeping, and
+        answers are simulated. This must be set before opening the window.
+
+        :param headless: Whether to run in headless mode.
+
+        :return: None
+        """
+        self._headless = headless
+        if headless:
+            self._virtual_time = self.virtualTime()
+            self._exp_clock = self.virtualClock(self._virtual_time)
+            self.kb = self.headlessKeyboard(self._virtual_time)
+        else:
+            self._virtual_time = None
+            self._exp_clock = exp_clock
+            # a new keyboard is created when it is first used
+            self.kb = None
+        self._simulate_keys(headless)
+
+    def _wait(self, secs):
+        # Wait for secs seconds, in headless mode only the virtual time moves
+        if self._headless:
+            self._virtual_time.advance(secs)
+        else:
+            core.wait(secs)
+
+    def _get_time(self):
+        # Current time in seconds
+        if self._headless:
+            return self._virtual_time.now
+        else:
+            return core.getTime()
+
+    def _new_clock(self):
+        # Clock that starts at zero
+        if self._headless:
+            return self.virtualClock(self._virtual_time)
+        else:
+            return core.Clock()
+
+    def _shape_stim(self, **kwargs):
+        # Create a ShapeStim for the current window
+        if self._headless:
+            return self.headlessStim(**kwargs)
+        else:
+            return visual.ShapeStim(self._win, **kwargs)
+
+    def _text_stim(self, **kwargs):
+        # Create a TextStim for the current window
+        if self._headless:
+            return self.headlessStim(**kwargs)
+        else:
+            return visual.TextStim(self._win, **kwargs)
+
+    class feedbackSounds:
+        def __init__(self, error_tone='A', correct_tone=None, delay=.1):
+            """
+            Feedback tones loaded once at the start of the session. Tones are scheduled with psychtoolbox and
+            played asynchronously, so play doesn't wait for the sound.
+
+            :param error_tone: Note or frequency of the tone played on incorrect trials.
+            :param correct_tone: Optional. Note or frequency of the tone played on correct trials. No tone if None.
+            :param delay: Optional. Time (s) between the call to play and the tone onset.
+            """
+            self._tones = {False: sound.Sound(error_tone),
+                           True: sound.Sound(correct_tone) if correct_tone is not None else None}
+            # Only the ptb backend schedules tones and reports their onsets
+            if sound.audioLib != 'ptb':
+                warnings.warn(f'Audio backend is {sound.audioLib}, not ptb: tones are not scheduled and their '
+                              f'actual onsets are not measured')
+            self.delay = delay
+            # Scheduled tones: trial, correct, scheduled onset and actual onset (filled in later)
+            self.log = []
+
+        def play(self, correct, trial=None):
+            """
+            Schedule the tone of a trial.
+
+            :return: Scheduled onset (psychtoolbox time) or None if there is no tone for the answer.
+            """
+            tone = self._tones[bool(correct)]
+            if tone is None:
+                return None
+            # the same tone is reused, stop it if it is still playing
+            if tone.isPlaying:
+                tone.stop()
+            self._update_onsets()
+            scheduled = ptb.GetSecs() + self.delay
+            tone.play(when=scheduled)
+            self.log.append({'trial_count': trial, 'correct': bool(correct), 'scheduled_onset': scheduled,
+                             'actual_onset': None})
+            return scheduled
+
+        def _actual_onset(self, correct):
+            # Onset reported by the audio device of the last tone played
+            try:
+                return self._tones[correct].track.status['StartTime']
+            except (AttributeError, KeyError, TypeError):
+                return None
+
+        def _update_onsets(self):
+            # The actual onset is known once the tone has started, it is read before scheduling the next one
+            for correct in (False, True):
+                pending = [x for x in self.log if x['correct'] == correct]
+                if pending and pending[-1]['actual_onset'] is None and self._tones[correct] is not None:
+                    pending[-1]['actual_onset'] = self._actual_onset(correct)
+
+        def save(self, file_name):
+            # Save scheduled and actual onsets as csv
+            self._update_onsets()
+            with open(file_name, 'w', newline='') as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=['trial_count', 'correct', 'scheduled_onset',
+                                                              'actual_onset', 'onset_error'])
+                writer.writeheader()
+                for row in self.log:
+                    onset_error = None if row['actual_onset'] is None else row['actual_onset'] - row['scheduled_onset']
+                    writer.writerow({**row, 'onset_error': onset_error})
+
+    def setup_feedback_sounds(self):
+        # Load feedback tones, there is no audio in headless mode
+        if not self._headless:
+            self._feedback_sounds = self.feedbackSounds(error_tone='A', correct_tone=self._correct_tone)
+
+    def save_feedback_log(self):
+        # Save the onsets of the feedback tones next to the session data
+        if self._feedback_sounds is None or not self._feedback_sounds.log:
+            return False
+        try:
+            self._feedback_sounds.save(self._filename_full_path + '_feedback.csv')
+            return True
+        except Exception as e:
+            print("Can't save the feedback log:", str(e))
+            return False
 
     def play_feedback(self, correct=None, show=None):
         """
-        Plays feedback sound on incorrect trials.
+        Plays feedback sound on incorrect trials (and on correct trials if a correct tone is set).
 
         Args:
             correct (bool, optional): The correctness of the trial. If None, the value from the current trial is used.
@@ -493,13 +1230,10 @@ class exp:
                 if correct is None:
                     # raise warning
                     warnings.warn('Accuracy is None, cannot give feedback')
-                # there is only feedback if the trial is incorrect
-                elif not correct:
-                    # play wrong sound
-                    wrong_sound = sound.Sound('A')
-                    now = ptb.GetSecs()
-                    wrong_sound.play(when=now+.1)
-                    core.wait(.1)
+                # schedule tone (incorrect trials, or any trial if there is a correct tone).
+                # It plays while the next trial starts
+                elif self._feedback_sounds is not None:
+                    self._feedback_sounds.play(correct, self._trial_count)
 
     def display_feedback(self, correct=None, show=None):
         """
@@ -526,16 +1260,160 @@ class exp:
                 warnings.warn('Accuracy is None, cannot give feedback')
             # there is only feedback if the trial is incorrect
             elif not correct:
-                self.show_message(text='INCORRECT', color='red', pos=[0,1],
-                                  height=self._default_text_height, wait_keypress=['+'], max_wait=.3)
+                self.show_message(**self._static_messages['incorrect'], wait_keypress=['+'], max_wait=.3)
+
+    class frameRecorder:
+        def __init__(self, win, file_name, every=1, roi=None, n_buffers=3, max_queue=120, fps=None):
+            """
+            Records the frames shown in the window without stalling the frame loop. After every flip the front
+            buffer is copied into one of a ring of pixel buffer objects (asynchronous read-back), and the buffer
+            filled n_buffers flips earlier, which is ready by then, is mapped and its pixels are put in a bounded
+            queue. A background thread encodes the queued frames. If the queue is full the frame is dropped and
+            counted instead of waiting for the encoder.
+
+            :param win: psychopy.visual.Window.
+            :param file_name: Output file. Movies (.mp4, .gif, ...) need imageio. Otherwise every frame is saved
+                              as <file_name>_<flip>.png.
+            :param every: Optional. Record one of every n flips (default: 1, every flip).
+            :param roi: Optional. Region (x, y, width, height) in pixels from the bottom left corner of the window.
+                        The whole window if None.
+            :param n_buffers: Optional. Pixel buffers in the ring (default: 3).
+            :param max_queue: Optional. Frames that can wait for the encoder (default: 120).
+            :param fps: Optional. Frame rate of the movie (default: 60 divided by every).
+            """
+            from pyglet import gl
+
+            if os.path.dirname(file_name) and not os.path.isdir(os.path.dirname(file_name)):
+                os.makedirs(os.path.dirname(file_name))
+            self._gl = gl
+            self.file_name = file_name
+            self.every = every
+            if roi is None:
+                roi = (0, 0) + tuple(win.size)
+            self._roi = tuple(int(x) for x in roi)
+            self._fps = fps if fps is not None else 60 / every
+            # Counters
+            self.flip_count = 0
+            self.frames_saved = 0
+            self.frames_dropped = 0
+
+            # Ring of pixel buffers and the flip each one holds (None if empty)
+            width, height = self._roi[2:]
+            self._buffers = (gl.GLuint * n_buffers)()
+            gl.glGenBuffers(n_buffers, self._buffers)
+            for buffer in self._buffers:
+                gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, buffer)
+                gl.glBufferData(gl.GL_PIXEL_PACK_BUFFER, width * height * 3, None, gl.GL_STREAM_READ)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+            self._pending = [None] * n_buffers
+            self._next_buffer = 0
+
+            # Background encoder
+            self._queue = queue.Queue(maxsize=max_queue)
+            self._encoder = threading.Thread(target=self._encode, name='frame_encoder', daemon=True)
+            self._encoder.start()
+
+        def capture(self):
+            # Start the read-back of the frame just flipped. Call it right after the flip
+            self.flip_count += 1
+            if (self.flip_count - 1) % self.every:
+                return
+            gl = self._gl
+            slot = self._next_buffer
+            self._next_buffer = (slot + 1) % len(self._buffers)
+            # The buffer still holds an older frame, its transfer is done by now
+            if self._pending[slot] is not None:
+                self._collect(slot)
+            # glReadPixels into a bound pixel buffer returns without waiting for the pixels
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self._buffers[slot])
+            gl.glReadBuffer(gl.GL_FRONT)
+            gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+            gl.glReadPixels(*self._roi, gl.GL_RGB, gl.GL_UNSIGNED_BYTE, 0)
+            gl.glReadBuffer(gl.GL_BACK)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+            self._pending[slot] = self.flip_count
+
+        def _collect(self, slot):
+            # Map a filled buffer and queue a copy of its pixels
+            gl = self._gl
+            width, height = self._roi[2:]
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self._buffers[slot])
+            pointer = gl.glMapBuffer(gl.GL_PIXEL_PACK_BUFFER, gl.GL_READ_ONLY)
+            pixels = ctypes.cast(pointer, ctypes.POINTER(ctypes.c_ubyte))
+            frame = np.ctypeslib.as_array(pixels, shape=(height, width, 3)).copy()
+            gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+            try:
+                self._queue.put_nowait((self._pending[slot], frame))
+            except queue.Full:
+                self.frames_dropped += 1
+            self._pending[slot] = None
+
+        def _encode(self):
+            # Background thread, writes frames until it gets None
+            movie = os.path.splitext(self.file_name)[1].lower() not in ('', '.png')
+            if movie:
+                import imageio
+                writer = imageio.get_writer(self.file_name, fps=self._fps)
+            else:
+                from PIL import Image
+                base_name = os.path.splitext(self.file_name)[0]
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                flip, frame = item
+                # OpenGL rows start at the bottom
+                frame = frame[::-1]
+                if movie:
+                    writer.append_data(frame)
+                else:
+                    Image.fromarray(frame).save(f'{base_name}_{str(flip).zfill(6)}.png')
+                self.frames_saved += 1
+            if movie:
+                writer.close()
+
+        def close(self):
+            # Collect the frames still in the buffers, wait for the encoder and free the buffers
+            for slot in sorted((x for x in range(len(self._buffers)) if self._pending[x] is not None),
+                               key=lambda x: self._pending[x]):
+                self._collect(slot)
+            self._queue.put(None)
+            self._encoder.join()
+            self._gl.glDeleteBuffers(len(self._buffers), self._buffers)
+            print(f'Recorded {self.frames_saved} frames to {self.file_name} ({self.frames_dropped} dropped)')
 
     def flip_record(self):
-        self._win.flip()
-        self._win.getMovieFrame()
+        flip_time = self._win.flip()
+        self._recorder.capture()
+        return flip_time
 
-    def _record_flips(self, record):
+    def _record_flips(self, record, file_name=None, every=1, roi=None, **recorder_kwargs):
+        """
+        Record the frames shown after every flip with a frameRecorder. Recording doesn't wait for the pixels, so
+        the timing of a recorded session is the same as the timing of a real one.
+
+        :param record: Start (True) or stop (False) recording.
+        :param file_name: Optional. Output file (default: <data file>_frames.mp4).
+        :param every: Optional. Record one of every n flips (default: 1).
+        :param roi: Optional. Region (x, y, width, height) in pixels to record. The whole window if None.
+        :param recorder_kwargs: Other frameRecorder settings (n_buffers, max_queue, fps). The movie plays at the
+                                frame rate of the experiment unless fps is given.
+        """
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+        # There are no pixels to record in headless mode
+        if record and self._headless:
+            warnings.warn('Frames cannot be recorded in headless mode')
+            return
         self._record_frames = record
         if record:
+            if file_name is None:
+                file_name = os.path.join(self._this_dir, 'data', (self._filename or 'recording') + '_frames.mp4')
+            if self._frame_rate is not None:
+                recorder_kwargs.setdefault('fps', self._frame_rate / every)
+            self._recorder = self.frameRecorder(self._win, file_name, every=every, roi=roi, **recorder_kwargs)
             self._flip_it = self.flip_record
         else:
             self._flip_it = self._win.flip
@@ -543,7 +1421,7 @@ class exp:
 
     def run_demographic_questions(self):
         # reset clock to get a better estimation of time
-        exp_clock.reset()
+        self._exp_clock.reset()
 
         print('Running demographic questions...')
 
@@ -558,35 +1436,40 @@ class exp:
 
         age_limit = [18, 35]
         age_question = f'How old are you? Type your answer and press SPACE when you are ready.'
-        text_stim = self.show_message(text=age_question + '\n\n ', height=self._default_text_height, wrapWidth=25, pos=[0, 0], anchorVert='center', return_text=True, color='black')
+        text_stim = self.show_message(text=age_question + '\n\n ', height=self._default_text_height, wrapWidth=25, pos=[0, 0], anchorVert='center', return_text=True, cache=False, color='black')
 
         text_stim.setAutoDraw(True)
         self._flip_it()
         # Ask for input
         age_text = ''
-        # Get keys
-        while True:
+        # Get keys. Presses made before the question are flushed only once, so digits typed quickly aren't lost
+        flush = True
+        age_done = False
+        while not age_done:
             # wait for keys
-            keys = event.waitKeys(keyList=all_digits + ['space', 'backspace'])
-            # add number
-            if not keys[0] in ['space', 'backspace']:
-                age_text += keys[0][-1]
-            # delete last
-            elif keys[0] == 'backspace':
-                age_text = age_text[:-1]
-            # submit only if age is correct
-            elif keys[0] == 'space':
-                if len(age_text):
-                    if age_limit[0] <= int(age_text) <= age_limit[1]:
-                        text_stim.setAutoDraw(False)
-                        self._flip_it()
+            keys = self.wait_for_keys(all_digits + ['space', 'backspace'], flush=flush)
+            flush = False
+            for key in [x.name for x in keys]:
+                # add number
+                if not key in ['space', 'backspace']:
+                    age_text += key[-1]
+                # delete last
+                elif key == 'backspace':
+                    age_text = age_text[:-1]
+                # submit only if age is correct
+                elif key == 'space':
+                    if len(age_text) and age_limit[0] <= int(age_text) <= age_limit[1]:
+                        age_done = True
                         break
 
-            # Update text with question and age
-            text_stim.setText(age_question + f'\n\n{age_text}')
+            if age_done:
+                text_stim.setAutoDraw(False)
+            else:
+                # Update text with question and age
+                text_stim.setText(age_question + f'\n\n{age_text}')
             self._flip_it()
 
-        core.wait(.3)
+        self._wait(.3)
         # Log answer
         self.exp_handler.addData('dem_age', age_text)
 
@@ -598,15 +1481,10 @@ class exp:
                                'I prefer not to say', 
                                height=self._default_text_height, wrapWidth=25, pos=[0, 0], anchorVert='center', color='black')
         key_list=list(filter(lambda x: x[-1] in ['1', '2', '3', '4'], all_digits))
-        # wait til buffer is clean
-        while True:
-            keys = self.kb.getKeys(keyList=key_list)
-            if not keys:
-                break
         # Capture keys
-        keys = self.waitKeys(keyList=key_list)
+        keys = self.wait_for_keys(key_list)
         self._flip_it()
-        core.wait(.3)
+        self._wait(.3)
         
         # Log answer
         self.exp_handler.addData('dem_gender', {'1': 'female', '2': 'male', '3': 'other', '4': 'not_say'}[keys[-1].name[-1]])
@@ -619,18 +1497,13 @@ class exp:
                                'put them on before continuing.\n\n1. Yes\n2. No',
                                height=self._default_text_height, wrapWidth=25, pos=[0, 0], anchorVert='center', color='black')
         key_list=list(filter(lambda x: x[-1] in ['1', '2'], all_digits))
-        # wait til buffer is clean
-        while True:
-            keys = self.kb.getKeys(keyList=key_list)
-            if not keys:
-                break
         # Capture keys
-        keys = self.waitKeys(keyList=key_list)
+        keys = self.wait_for_keys(key_list)
         self._flip_it()
-        core.wait(.3)
+        self._wait(.3)
         # Log answer
         self.exp_handler.addData('dem_vision', {'1': 'corrected', '2': 'uncorrected'}[keys[-1].name[-1]])
-        self.exp_handler.nextEntry()
+        self._next_entry()
         print('Demographic questions done')
     
     @staticmethod
@@ -655,42 +1528,241 @@ class exp:
     def win(self):
         return self._win
 
-    def save_csv(self):
-        print('\n\n')
+    class columnarTable:
+        """
+        Typed columnar version of the wide CSV, saved as a numpy .npz file. Each column keeps its type instead of
+        being stored as text: booleans as bool arrays, numbers as float (or int) arrays, and strings (e.g.
+        directions, tasks) as integer codes plus a categories array. Missing values are stored in a mask for
+        booleans, as NaN for floats and as code -1 for strings.
+        """
 
-        data_saved_locally = False
-        data_saved_exp_folder = False
-        data_saved_project_folder = False
+        @staticmethod
+        def _column_type(values):
+            # 'bool', 'int', 'float' or 'category', ignoring missing values
+            present = [x for x in values if x is not None and not (isinstance(x, float) and np.isnan(x))]
+            if not present:
+                return 'float'
+            if all(isinstance(x, (bool, np.bool_)) for x in present):
+                return 'bool'
+            if all(isinstance(x, (int, np.integer)) and not isinstance(x, (bool, np.bool_)) for x in present):
+                return 'int' if len(present) == len(values) else 'float'
+            if all(isinstance(x, (int, float, np.integer, np.floating)) and not isinstance(x, (bool, np.bool_)) for x in present):
+                return 'float'
+            return 'category'
+
+        @classmethod
+        def encode(cls, columns: dict):
+            """
+            Encode columns into typed arrays.
+
+            :param columns: Column name and list of values.
+
+            :return: Dictionary of numpy arrays ready for np.savez.
+            """
+            arrays = {'__columns__': np.array(list(columns), dtype=str)}
+            for name, values in columns.items():
+                missing = np.array([x is None or (isinstance(x, float) and np.isnan(x)) for x in values], dtype=bool)
+                column_type = cls._column_type(values)
+                if column_type == 'bool':
+                    arrays[name] = np.array([bool(x) if not m else False for x, m in zip(values, missing)], dtype=bool)
+                    if missing.any():
+                        arrays[f'{name}__mask'] = missing
+                elif column_type == 'int':
+                    arrays[name] = np.array(values, dtype=np.int64)
+                elif column_type == 'float':
+                    arrays[name] = np.array([np.nan if m else float(x) for x, m in zip(values, missing)], dtype=float)
+                else:
+                    # strings (and mixed values) are stored as categories
+                    text = [None if m else str(x) for x, m in zip(values, missing)]
+                    categories = sorted(set(x for x in text if x is not None))
+                    codes = {x: i for i, x in enumerate(categories)}
+                    arrays[name] = np.array([-1 if x is None else codes[x] for x in text], dtype=np.int32)
+                    arrays[f'{name}__categories'] = np.array(categories, dtype=str)
+            return arrays
+
+        @classmethod
+        def from_entries(cls, entries: list):
+            # Encode exp_handler entries. Columns are in the order they were first seen
+            names = {}
+            for entry in entries:
+                names.update(dict.fromkeys(entry))
+            return cls.encode({name: [entry.get(name) for entry in entries] for name in names})
+
+        @classmethod
+        def save(cls, file_name: str, arrays: dict):
+            # Save encoded columns (compressed)
+            np.savez_compressed(file_name, **arrays)
+
+        @staticmethod
+        def load(file_name: str):
+            """
+            Load a columnar file.
+
+            :return: Dictionary with column name and (array, missing mask, categories). The mask and the
+                     categories are None when the column doesn't use them.
+            """
+            with np.load(file_name) as npz:
+                columns = {}
+                for name in npz['__columns__']:
+                    mask = npz[f'{name}__mask'] if f'{name}__mask' in npz.files else None
+                    categories = npz[f'{name}__categories'] if f'{name}__categories' in npz.files else None
+                    columns[str(name)] = (npz[name], mask, categories)
+            return columns
+
+        @classmethod
+        def to_dataframe(cls, file_name: str):
+            """
+            Load a columnar file as a pandas DataFrame. Booleans with missing values use the nullable 'boolean'
+            dtype and strings are categoricals.
+            """
+            import pandas as pd
+
+            data = {}
+            for name, (values, mask, categories) in cls.load(file_name).items():
+                if categories is not None:
+                    data[name] = pd.Categorical.from_codes(values, categories=list(categories))
+                elif mask is not None:
+                    data[name] = pd.array(np.where(mask, None, values), dtype='boolean')
+                else:
+                    data[name] = values
+            return pd.DataFrame(data)
 
-        # ONLINE: Attempt to save csv file in data folder in experiment folder
+    def save_columnar(self):
+        # Save the typed columnar version of the session data next to the csv in the data folder
         try:
-            self.exp_handler.saveAsWideText(self._filename_full_path + '.csv')
-            data_saved_exp_folder = True
+            arrays = self.columnarTable.from_entries(self.exp_handler.getAllEntries())
+            self.columnarTable.save(self._filename_full_path + '.npz', arrays)
+            return True
         except Exception as e:
-            print("Can't save the file:", str(e))
-        # ONLINE: Attempt to save csv file in project data folder
-        try:
-            self.exp_handler.saveAsWideText(os.path.join(os.path.dirname(_thisDir), 'Data', self._filename + '.csv'))
-            data_saved_project_folder = True
-        except OSError as e:
-            print("Can't save the file:", str(e))
+            print("Can't save the columnar file:", str(e))
+            return False
+
+    def _write_csv(self, file_name, csv_data, checksum):
+        """
+        Write the session csv to one destination and check the copy. The write is retried if it fails
+        or if the checksum of the copy doesn't match. Missing folders and denied writes fail right away.
+
+        Parameters:
+            file_name (str): Destination file.
+            csv_data (bytes): CSV file content.
+            checksum (str): sha256 of csv_data.
+
+        Returns:
+            None. Raises OSError if all the attempts fail.
+        """
+        error = None
+        for attempt in range(self._save_retries):
+            try:
+                # Write copy
+                with open(file_name, 'wb') as csv_file:
+                    csv_file.write(csv_data)
+                    csv_file.flush()
+                    os.fsync(csv_file.fileno())
+                # Read it back and compare checksums
+                with open(file_name, 'rb') as csv_file:
+                    if hashlib.sha256(csv_file.read()).hexdigest() == checksum:
+                        return
+                error = OSError(f'checksum mismatch in {file_name}')
+            except (FileNotFoundError, PermissionError):
+                # a missing folder or a denied write won't be fixed by trying again
+                raise
+            except OSError as e:
+                error = e
+            # wait a bit before trying again, but not after the last attempt
+            if attempt + 1 < self._save_retries:
+                time.sleep(.5 * (attempt + 1))
+        raise error
+
+    def _export_csv(self, csv_data, destinations):
+        """
+        Write the session csv to all destinations at the same time. Every destination is written by its own
+        thread and has its own timeout, so a slow network share doesn't hold up the other destinations.
+
+        Parameters:
+            csv_data (bytes): CSV file content.
+            destinations (dict): Destination name and file path.
+
+        Returns:
+            dict: Destination name and error (None if the copy was saved and its checksum matches).
+        """
+        checksum = hashlib.sha256(csv_data).hexdigest()
+        errors = {name: None for name in destinations}
+
+        def write_destination(name, file_name):
+            try:
+                self._write_csv(file_name, csv_data, checksum)
+            except Exception as e:
+                errors[name] = e
+
+        # Start writers. Threads are daemons so a hanging destination can't keep the experiment from quitting
+        writers = {}
+        for name, file_name in destinations.items():
+            writers[name] = threading.Thread(target=write_destination, args=(name, file_name), daemon=True)
+            writers[name].start()
+
+        # Wait for every writer until its timeout
+        deadline = time.time() + self._save_timeout
+        for name, writer in writers.items():
+            writer.join(timeout=max(deadline - time.time(), 0))
+            if writer.is_alive():
+                errors[name] = TimeoutError(f'saving to {destinations[name]} took more than {self._save_timeout} s')
+
+        return errors
 
-        # OFFLINE: Attemp to save csv file locally
+    def save_csv(self):
+        print('\n\n')
+
+        # Build the csv once. The exp handler writes it to a temporary folder, so every destination gets
+        # the same bytes saveAsWideText writes
+        csv_data = None
         try:
-            self.exp_handler.saveAsWideText(os.path.join(r'C:\Users\prime\DATA', self._filename + '.csv'))
-            data_saved_locally = True
-        except OSError as e:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                temp_file_name = os.path.join(temp_dir, self._filename + '.csv')
+                self.exp_handler.saveAsWideText(temp_file_name)
+                with open(temp_file_name, 'rb') as csv_file:
+                    csv_data = csv_file.read()
+        except Exception as e:
             print("Can't save the file:", str(e))
+        # If the exp handler fails, recover the trials from the trial stream. The last entry is added if it
+        # wasn't finished
+        if csv_data is None and self._trial_stream is not None:
+            try:
+                last_entry = [dict(self.exp_handler.thisEntry, **self.exp_handler.extraInfo)] if self.exp_handler.thisEntry else []
+                csv_data = self._trial_stream.to_csv_text(extra_info_names=list(self.exp_handler.extraInfo),
+                                                          extra_entries=last_entry).encode('utf-8')
+                print('Data recovered from the trial stream')
+            except Exception as e:
+                print("Can't read the trial stream:", str(e))
+        self._close_trial_stream()
+
+        # ONLINE: data folder in experiment folder and project data folder
+        # OFFLINE: local folder
+        destinations = {'Exp': self._filename_full_path + '.csv',
+                        'Project': os.path.join(os.path.dirname(_thisDir), 'Data', self._filename + '.csv'),
+                        'Local': os.path.join(r'C:\Users\prime\DATA', self._filename + '.csv')}
+        if csv_data is not None:
+            errors = self._export_csv(csv_data, destinations)
+        else:
+            errors = {name: 'no data to save' for name in destinations}
+        for name, error in errors.items():
+            if error is not None:
+                print(f"Can't save the file ({name} folder):", str(error))
+
+        # Typed columnar file in the experiment data folder
+        columnar_saved = self.save_columnar()
+        # Feedback tone onsets
+        self.save_feedback_log()
         
         # Print 
         print('\n\n#############################\n')
-        print(f'Data saved on Exp folder:       {data_saved_exp_folder}')
-        print(f'Data saved on Project folder:   {data_saved_project_folder}')
-        print(f'Data saved on Local folder:     {data_saved_locally}')
+        print(f'Data saved on Exp folder:       {errors["Exp"] is None}')
+        print(f'Data saved on Project folder:   {errors["Project"] is None}')
+        print(f'Data saved on Local folder:     {errors["Local"] is None}')
+        print(f'Columnar data saved:            {columnar_saved}')
         print('\n#############################\n\n')
 
     def make_fixation(self):
-        return visual.ShapeStim(self._win, vertices='cross', lineColor='black', fillColor='black', size=.3, units='deg')
+        return self._shape_stim(vertices='cross', lineColor='black', fillColor='black', size=.3, units='deg')
 
     def make_prime(self, direction, vertical_position):
         """
@@ -747,7 +1819,7 @@ class exp:
             prime_coords = (0, 0)
 
         # Draw the scaled arrow using polygon
-        arrow = visual.ShapeStim(self.win, name='prime', vertices=oriented_vertices, pos=prime_coords, 
+        arrow = self._shape_stim(name='prime', vertices=oriented_vertices, pos=prime_coords, 
                                  lineColor='black', fillColor='black', size=1, units='deg', interpolate=False,
                                  contrast=self._prime_contrast)
 
@@ -816,7 +1888,7 @@ class exp:
             mask_coords = (0, 0)
 
         # Draw mask
-        mask_back = visual.ShapeStim(self.win, name='mask_back', vertices=oriented_vertices, pos=mask_coords, 
+        mask_back = self._shape_stim(name='mask_back', vertices=oriented_vertices, pos=mask_coords, 
                                      lineColor='black', fillColor='black', size=1, units='deg',
                                      opacity=self._mask_contrast, interpolate=False)
 
@@ -862,12 +1934,183 @@ class exp:
             mask_coords = (0, 0)
 
         # Draw mask
-        mask_front = visual.ShapeStim(self.win, name='mask_fore', vertices=vertices, pos=mask_coords, 
+        mask_front = self._shape_stim(name='mask_fore', vertices=vertices, pos=mask_coords, 
                                       lineColor='white', fillColor='white', size=1, units='deg',
                                      opacity=self._mask_contrast, interpolate=False)
 
         return self.create_stim_attributes(mask_front)
-        
+
+    def _make_cache_stim(self, stim_type, direction, position):
+        # Build a single stimulus for the stimuli cache
+        if stim_type == 'prime':
+            return self.make_prime(direction, position)
+        elif stim_type == 'mask_back':
+            return self.make_mask_back(direction, position)
+        elif stim_type == 'mask_fore':
+            return self.make_mask_front(position)
+        elif stim_type == 'fixation':
+            return self.make_fixation()
+        elif stim_type == 'fixation_gray':
+            fixation_gray = self.make_fixation()
+            fixation_gray.setColor('lightgray')
+            return fixation_gray
+        else:
+            raise ValueError(f'Unknown stimulus type: {stim_type}')
+
+    def _stim_cache_key(self, stim_type, direction=None, position=None):
+        # The contrast is part of the key so a contrast change doesn't reuse stale stimuli
+        if stim_type == 'prime':
+            return (stim_type, direction, position, self._prime_contrast)
+        elif stim_type == 'mask_back':
+            return (stim_type, direction, position, self._mask_contrast)
+        elif stim_type == 'mask_fore':
+            return (stim_type, None, position, self._mask_contrast)
+        else:
+            return (stim_type, None, None, None)
+
+    def build_stim_cache(self):
+        """
+        Pre-build all the stimuli used in present_stimuli for every prime direction, mask direction and
+        position with the current contrast values. The stimuli are only built once, so trial setup becomes
+        a dictionary lookup instead of creating and tessellating new ShapeStims right before the trial.
+
+        Returns:
+            None
+        """
+        # Check window
+        if self._win is None:
+            raise ValueError('Window is not open. Please open a window before building the stimuli cache.')
+
+        self._stim_cache = {}
+        for position in self._stim_positions:
+            for direction in self._prime_directions:
+                self.get_cached_stim('prime', direction, position)
+            for direction in self._mask_directions:
+                self.get_cached_stim('mask_back', direction, position)
+            self.get_cached_stim('mask_fore', position=position)
+        self.get_cached_stim('fixation')
+        self.get_cached_stim('fixation_gray')
+
+    def get_cached_stim(self, stim_type, direction=None, position=None):
+        """
+        Get a ready-to-draw stimulus from the stimuli cache. Stimuli missing from the cache (e.g. after a
+        contrast change) are built and stored on the first request.
+
+        Parameters:
+        - stim_type (str): 'prime', 'mask_back', 'mask_fore', 'fixation' or 'fixation_gray'.
+        - direction (str): The direction of the arrow. Ignored for the mask foreground and the fixations.
+        - position (str): The vertical position of the stimulus. Ignored for the fixations.
+
+        Returns:
+        - stim (visual.ShapeStim): The cached stimulus with fresh timing attributes.
+
+        """
+        if self._stim_cache is None:
+            self._stim_cache = {}
+
+        # Get stimulus or build it if it's not in the cache
+        key = self._stim_cache_key(stim_type, direction, position)
+        stim = self._stim_cache.get(key)
+        if stim is None:
+            stim = self._make_cache_stim(stim_type, direction, position)
+            self._stim_cache[key] = stim
+
+        # Make sure the stimulus is not drawn and reset the timing attributes
+        stim.setAutoDraw(False)
+        return self.create_stim_attributes(stim)
+
+    class frameSchedule:
+        """
+        Frame-indexed event table of a trial. The onset and offset frames of the stimuli are computed once
+        when the trial is compiled, so the trial loop only looks up the events of the current frame instead of
+        checking every condition on every frame.
+
+        Events:
+            prime_on, prime_off: prime onset and offset.
+            mask_on, mask_off: mask (back and fore) onset and offset.
+            response_open: fixation turns gray and mask responses are collected from the next frame (mask task).
+            end: last frame of the trial (prime task).
+        """
+
+        def __init__(self, task, fixation_f, prime_f, soa_f, mask_f, response_window_f):
+            self.task = task
+            self.events = {}
+
+            # Prime
+            self._add(fixation_f, 'prime_on')
+            self._add(fixation_f + prime_f, 'prime_off')
+            # Mask
+            mask_onset = fixation_f + soa_f
+            self._add(mask_onset, 'mask_on')
+            if task == 'mask':
+                self._add(mask_onset, 'response_open')
+            self._add(mask_onset + mask_f, 'mask_off')
+            if task == 'prime':
+                self._add(mask_onset + mask_f, 'end')
+            # Mask trials are aborted if there is no response at this frame
+            self.response_close = mask_onset + response_window_f if task == 'mask' else None
+            # Frames from the prime onset to the prime offset or the mask onset (prime duration and SOA)
+            self.timing_window = (fixation_f, max(fixation_f + prime_f, mask_onset))
+            # Maximum number of flips of the trial
+            self.n_frames = max(list(self.events) + [self.response_close or 0]) + 2
+
+            # Events are tuples, the trial loop only reads them
+            self.events = {frame: tuple(events) for frame, events in self.events.items()}
+
+        def _add(self, frame, event):
+            self.events.setdefault(frame, []).append(event)
+
+        def rows(self, frame_rate=None):
+            """
+            Events as a list of dictionaries (frame, event and time from the fixation onset if frame_rate is set),
+            sorted by frame.
+            """
+            rows = []
+            for frame in sorted(self.events):
+                for event_name in self.events[frame]:
+                    row = {'task': self.task, 'frame': frame, 'event': event_name}
+                    if frame_rate is not None:
+                        row['time'] = frame / frame_rate
+                    rows.append(row)
+            if self.response_close is not None:
+                row = {'task': self.task, 'frame': self.response_close, 'event': 'response_close'}
+                if frame_rate is not None:
+                    row['time'] = self.response_close / frame_rate
+                rows.append(row)
+            return rows
+
+    def compile_frame_schedule(self, task, soa):
+        """
+        Get the frame schedule of a trial. Schedules are compiled once for each task, soa and timing settings.
+
+        :param task: 'prime' or 'mask'.
+        :param soa: SOA in seconds. It is converted to the closest number of frames.
+
+        :return: frameSchedule.
+        """
+        key = (task, self._fixation_duration_f, self._prime_duration_f, self._to_frames(soa),
+               self._mask_duration_f, self._to_frames(.7))
+        if key not in self._frame_schedules:
+            self._frame_schedules[key] = self.frameSchedule(*key)
+        return self._frame_schedules[key]
+
+    def save_frame_schedules(self, file_name, soas=None):
+        """
+        Save the schedules of both tasks and all the SOAs in a csv file, to check the stimuli timing.
+
+        :param file_name: csv file.
+        :param soas: Optional. SOAs in seconds. Defaults to the possible SOAs of the experiment.
+        """
+        rows = []
+        for task in self._tasks:
+            for soa in (self._possible_SOAs_s if soas is None else soas):
+                for row in self.compile_frame_schedule(task, soa).rows(self._frame_rate):
+                    rows.append({'soa': soa, **row})
+        with open(file_name, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=['task', 'soa', 'frame', 'event', 'time'])
+            writer.writeheader()
+            writer.writerows(rows)
+
     def present_stimuli(self, task, prime_direction, mask_direction, position, soa, prime_presence='present'):
         """
         Run a mask or prime trial.
@@ -876,7 +2119,7 @@ class exp:
         prime_direction (str): The direction of the prime stimulus ('left' or 'right').
         mask_direction (str): The direction of the mask stimulus ('left' or 'right').
         position (tuple): Coodinates indicating the position of the stimuli (both prime and mask) on the screen.
-        soa (float): The stimulus onset asynchrony (SOA) in seconds. The time will be converted to frames and it is assumed that the time in seconds can be achieved in frames. If it is not possible the time in frames is rounded using int().
+        soa (float): The stimulus onset asynchrony (SOA) in seconds. The time will be converted to frames and it is assumed that the time in seconds can be achieved in frames. If it is not possible the time is rounded to the closest frame (see calibrate_refresh).
         prime_presence (str): Whether the prime is present or not. Defaults to True.
         Returns:
         None
@@ -902,8 +2145,12 @@ class exp:
         ## mask: mask discrimination and prime detection
         ## prime: prime discrimination
         
-        # get task
+        # get task and trial parameters
         self._this_trial_task = task
+        self._this_trial_soa = soa
+        self._this_trial_congruent = prime_direction == mask_direction
+        self._this_trial_prime_presence = prime_presence
+        self._simulated_response = None
         # get correct response
         if self._this_trial_task == 'prime':
             self._this_trial_prime_correct_response = prime_direction
@@ -911,30 +2158,40 @@ class exp:
             self._this_trial_mask_correct_response = mask_direction
             self._this_trial_prime_correct_response = prime_presence
 
-        # make stimuli
-        prime = self.make_prime(prime_direction, position)
-        mask_back = self.make_mask_back(mask_direction, position)
-        mask_fore = self.make_mask_front(position)
+        # get stimuli from cache
+        prime = self.get_cached_stim('prime', prime_direction, position)
+        mask_back = self.get_cached_stim('mask_back', mask_direction, position)
+        mask_fore = self.get_cached_stim('mask_fore', position=position)
 
-        # set prime presence
-        if prime_presence == 'absent':
-            prime.opacity = 0
+        # set prime presence. The prime is cached, so the opacity is set on every trial
+        prime.opacity = 0 if prime_presence == 'absent' else 1
 
-        # make fixation
-        fixation = self.make_fixation()
+        # get fixation from cache
+        fixation = self.get_cached_stim('fixation')
         fixation.setAutoDraw(True)
-        fixation_gray = self.make_fixation()
-        fixation_gray.setColor('lightgray')
+        fixation_gray = self.get_cached_stim('fixation_gray')
 
-        # transform soa into frames
-        self._soa_f = int(soa * self._frame_rate)
+        # transform soa into frames and get the frame schedule of the trial
+        self._soa_f = self._to_frames(soa)
+        schedule = self.compile_frame_schedule(task, soa)
+        schedule_events = schedule.events
+        response_close = schedule.response_close
+
+        # flip times buffer, flip times are stored by frame number + 1
+        if len(self._frame_times) < schedule.n_frames:
+            self._frame_times = np.zeros(schedule.n_frames)
+        frame_times = self._frame_times
 
         # Pre create some vars
         look_for_mask_response = False
         self.kb.clearEvents(eventType='keyboard')
+        # responses and escape are collected in the background (real keyboard only)
+        collector = self._get_response_collector()
+        if collector is not None:
+            collector.start()
 
         # trial duration clock
-        trial_clock = core.Clock()
+        trial_clock = self._new_clock()
         self._win.callOnFlip(trial_clock.reset)
         trial_start_time = {'time': None}
         self._win.timeOnFlip(trial_start_time, 'time')
@@ -945,7 +2202,7 @@ class exp:
         self.trial_aborted = False
         while continue_routine:
             # Get frame time
-            t = core.getTime()
+            t = self._get_time()
             
             # Capture mask response if mask trial ----------------
             
@@ -953,7 +2210,7 @@ class exp:
             if look_for_mask_response:
                 
                 # Abort trial if 700 ms after mask onset
-                if frame_number >= (mask_back.frame_start + int(self._frame_rate * .7)):
+                if frame_number >= response_close:
                     # Draw fixation off
                     fixation_gray.setAutoDraw(False)
                     # End routine
@@ -961,7 +2218,10 @@ class exp:
                     self.trial_aborted = True
                 else:
                     # search for keys
-                    keys_mask = self.getKeys(keyList=['a', 'l'])
+                    if collector is not None:
+                        keys_mask = [] if collector.response is None else [collector.response]
+                    else:
+                        keys_mask = self.getKeys(keyList=['a', 'l'])
                     if len(keys_mask) and continue_routine:
                         # Draw fixation off
                         fixation_gray.setAutoDraw(False)
@@ -973,49 +2233,65 @@ class exp:
                         # End routine
                         continue_routine = False
 
-            # Prime ----------------------------------------------
-            
-            if frame_number == self._fixation_duration_f:
-                prime = self.draw_stim_on(prime, t, frame_number)
-            elif frame_number == self._fixation_duration_f + self._prime_duration_f:
-                prime = self.draw_stim_off(prime, t, frame_number)
-
-            # Mask -----------------------------------------------
-
-            if frame_number == self._fixation_duration_f + self._soa_f:
-                # Draw mask on
-                mask_back = self.draw_stim_on(mask_back, t, frame_number)
-                mask_fore = self.draw_stim_on(mask_fore, t, frame_number)
-                if self._this_trial_task == 'mask':
+            # Scheduled events -----------------------------------
+
+            for event_name in schedule_events.get(frame_number, ()):
+                # Prime
+                if event_name == 'prime_on':
+                    prime = self.draw_stim_on(prime, t, frame_number)
+                elif event_name == 'prime_off':
+                    prime = self.draw_stim_off(prime, t, frame_number)
+                # Mask
+                elif event_name == 'mask_on':
+                    mask_back = self.draw_stim_on(mask_back, t, frame_number)
+                    mask_fore = self.draw_stim_on(mask_fore, t, frame_number)
+                elif event_name == 'mask_off':
+                    mask_back = self.draw_stim_off(mask_back, t, frame_number)
+                    mask_fore = self.draw_stim_off(mask_fore, t, frame_number)
+                # Draw fixation and look for responses
+                elif event_name == 'response_open':
                     # Change fixation color to red to indicate response time
                     fixation.setAutoDraw(False)
                     fixation_gray.setAutoDraw(True)
                     # reset keyboard time and start looking for mask responses on the next frame
                     look_for_mask_response = True
-                    self._win.callOnFlip(self.kb.clock.reset)
-                    self._win.callOnFlip(self.kb.clearEvents, eventType='keyboard')
-            elif frame_number == self._fixation_duration_f +  self._soa_f + self._mask_duration_f:
-                # Draw mask off
-                mask_back = self.draw_stim_off(mask_back, t, frame_number)
-                mask_fore = self.draw_stim_off(mask_fore, t, frame_number)
-                if task == 'prime':
+                    if collector is not None:
+                        self._win.callOnFlip(collector.open)
+                    else:
+                        self._win.callOnFlip(self.kb.clock.reset)
+                        self._win.callOnFlip(self.kb.clearEvents, eventType='keyboard')
+                elif event_name == 'end':
                     continue_routine = False
             
-            # Flip screen
-            self._flip_it()
+            # Flip screen and record flip time
+            flip_time = self._flip_it()
             frame_number += 1
+            frame_times[frame_number] = flip_time
 
             # check for escape and abort experiment
-            if 'escape' in event.getKeys():
+            if collector is not None:
+                escape = collector.escape
+            else:
+                escape = not self._headless and 'escape' in event.getKeys()
+            if escape:
                 self._win.close()
+                self._close_trial_stream()
                 core.quit()
 
+        # Stop background collection before the keyboard is used again
+        if collector is not None:
+            collector.stop()
+            event.clearEvents(eventType='keyboard')
+
+        # Check frame timing
+        frame_timing = self.check_frame_timing(schedule, frame_number + 1)
+        self.trial_timing_error = frame_timing['timing_error']
 
         # Mask aborted trials ----------------
         
         if self.trial_aborted:
             # show message indicating that responses should be faster
-            self.show_message(text='Too slow!\nPress A or L to continue to the next trial.', color='red', pos=[0,0], height=self._default_text_height, wait_keypress=['a', 'l'])
+            self.show_message(**self._static_messages['too_slow'], wait_keypress=['a', 'l'])
             self.exp_handler.addData('trial_aborted', self.trial_aborted)
             # set empty vars
             self._this_trial_mask_answer = None
@@ -1034,25 +2310,20 @@ class exp:
                 self.display_feedback()
 
                 # wait before prompting to detect prime
-                core.wait(.25)
+                self._wait(.25)
 
                 # Prompt for prime detection
-                prime_detection_prompt = self.show_message(text='Was the prime present?\n\n  ABSENT               PRESENT', 
-                                height=self._default_text_height, wrapWidth=25, pos=[0, 0.8], 
-                                color='black', return_text=True)
+                prime_detection_prompt = self.show_message(**self._static_messages['prime_detection'], return_text=True)
                 prime_detection_prompt.setAutoDraw(True)
                 # Change fixation color to lightgray to indicate response time
                 fixation.setAutoDraw(False)
                 fixation_gray.setAutoDraw(True)
-                # Reset keyboard on prompt
+                # Reset keyboard time on prompt
                 self._win.callOnFlip(self.kb.clock.reset)
-                self._win.callOnFlip(self.kb.clearEvents, eventType='keyboard')
-                while self.kb.getKeys():
-                    self.kb.clearEvents()
                 # Update screen
                 self._flip_it()
                 # Get response        
-                keys_prime = self.waitKeys(keyList=['a', 'l'], clear=True)
+                keys_prime = self.wait_for_keys(['a', 'l'], reset_clock=False)
                 # Draw prompt off
                 prime_detection_prompt.setAutoDraw(False)
                 self._flip_it()
@@ -1063,7 +2334,7 @@ class exp:
 
             elif self._this_trial_task == 'prime':
                 # wait before prompting to discrimination prime
-                core.wait(.6)
+                self._wait(.6)
 
                 # Change fixation color to red to indicate response time
                 fixation.setAutoDraw(False)
@@ -1125,7 +2396,7 @@ class exp:
         self.exp_handler.addData('prime_answer_key', self._this_trial_prime_answer)
         self.exp_handler.addData('prime_accuracy', self._this_trial_prime_accuracy)
         self.exp_handler.addData('prime_rt', self._this_trial_prime_rt)
-        self.exp_handler.addData('exp_time', exp_clock.getTime())
+        self.exp_handler.addData('exp_time', self._exp_clock.getTime())
         self.exp_handler.addData('trial_dur', trial_clock.getTime())
         self.exp_handler.addData('trial_aborted', self.trial_aborted)
         self.exp_handler.addData('trial_start', trial_start_time['time'])
@@ -1135,6 +2406,8 @@ class exp:
         self.log_stim_time(prime)
         self.log_stim_time(mask_back)
         self.log_stim_time(mask_fore)
+        for key, value in frame_timing.items():
+            self.exp_handler.addData(key, value)
 
         if self._print_answer_info:
             print('     direction: ', prime_direction)
@@ -1145,6 +2418,29 @@ class exp:
             print('     mask-accuracy:', self._this_trial_mask_accuracy)
             print('     mask-rt (s):', round(self._this_trial_mask_rt, 4) if self._this_trial_mask_rt else None)
     
+    def check_frame_timing(self, schedule, n_flips):
+        """
+        Check the flip times recorded during the last trial. Intervals between flips that differ from
+        1/frame_rate by more than the frame tolerance are flagged, and the trial has a timing error if any of
+        them happened while the prime or the SOA were on screen.
+
+        Parameters:
+            schedule (frameSchedule): Frame schedule of the trial.
+            n_flips (int): Number of flips recorded in the trial.
+
+        Returns:
+            dict: frame_interval_max (s), dropped_frames (intervals longer than expected) and timing_error.
+        """
+        intervals = np.diff(self._frame_times[:n_flips])
+        frame_interval = 1 / self._frame_rate
+        off_frames = np.abs(intervals - frame_interval) > frame_interval * self._frame_tolerance
+        # interval i ends on the flip of frame i + 1
+        start, stop = schedule.timing_window
+
+        return {'frame_interval_max': float(intervals.max()) if len(intervals) else None,
+                'dropped_frames': int((intervals > frame_interval * (1 + self._frame_tolerance)).sum()),
+                'timing_error': bool(off_frames[start + 1:stop + 1].any())}
+
     @staticmethod
     def create_stim_attributes(stim):
         """
@@ -1255,6 +2551,247 @@ class exp:
 
         return stim
     
+    class trialTable:
+        def __init__(self, data, levels):
+            """
+            Trials stored in a numpy structured array, one row per trial. Text factors (directions, positions,
+            prime presence) are stored as integer codes and levels has the value of each code.
+
+            :param data: numpy structured array.
+            :param levels: Dictionary with the column name and list of levels of the coded columns.
+            """
+            self.data = data
+            self.levels = levels
+
+        @classmethod
+        def from_trials(cls, trials: list):
+            # Create a table from a list of trial dictionaries. Booleans and numbers keep their type,
+            # any other value is coded
+            names = list(trials[0])
+            columns = {name: [trial[name] for trial in trials] for name in names}
+            dtype, levels = [], {}
+            for name, values in columns.items():
+                if all(isinstance(x, (bool, np.bool_)) for x in values):
+                    dtype.append((name, '?'))
+                elif all(isinstance(x, (int, float, np.integer, np.floating)) for x in values):
+                    dtype.append((name, 'f8'))
+                else:
+                    levels[name] = sorted(set(values))
+                    dtype.append((name, 'i2'))
+            data = np.empty(len(trials), dtype=dtype)
+            for name, values in columns.items():
+                if name in levels:
+                    codes = {x: i for i, x in enumerate(levels[name])}
+                    data[name] = [codes[x] for x in values]
+                else:
+                    data[name] = values
+            return cls(data, levels)
+
+        def __len__(self):
+            return len(self.data)
+
+        def __iter__(self):
+            # Trials as dictionaries, in row order
+            return (self.row(i) for i in range(len(self.data)))
+
+        def row(self, index):
+            # Trial as a dictionary with the original values
+            trial = self.data[index]
+            return {name: self.levels[name][trial[name]] if name in self.levels else trial[name].item()
+                    for name in self.data.dtype.names}
+
+        def columns(self):
+            # Decoded columns, e.g. to log or save the trial list
+            return {name: np.asarray(self.levels[name])[self.data[name]] if name in self.levels else self.data[name]
+                    for name in self.data.dtype.names}
+
+        def repeat(self, n):
+            return exp.trialTable(np.tile(self.data, n), self.levels)
+
+        def head(self, n):
+            return exp.trialTable(self.data[:n].copy(), self.levels)
+
+        def sample(self, n):
+            # n trials without replacement
+            return exp.trialTable(self.data[np.random.choice(len(self.data), n, replace=False)], self.levels)
+
+        def shuffle(self, shuffler=None, rng=None):
+            # Shuffle the rows in place, with the constraints of a constrainedShuffler if given.
+            # Trials are run from the last row, so the order is reversed
+            if shuffler is None:
+                (np.random if rng is None else rng).shuffle(self.data)
+            else:
+                self.data = self.data[shuffler.order(self, rng)[::-1]]
+
+        def queue(self, rng=None, shuffler=None):
+            # With a shuffler, aborted trials are requeued keeping its run lengths
+            accept = None
+            if shuffler is not None and shuffler.max_runs:
+                codes = shuffler.codes(self)
+                accept = lambda order: shuffler.valid_runs(codes, order)
+            return exp.trialQueue(len(self.data), rng, accept)
+
+    class trialQueue:
+        def __init__(self, n, rng=None, accept=None):
+            """
+            Order in which the rows of a trialTable are run. Trials are drawn from the end of the queue and
+            aborted trials are put back in a random position of the remaining trials, both in constant time
+            (without accept).
+
+            :param n: Number of trials.
+            :param rng: Optional. numpy Generator used to requeue trials. np.random is used if None.
+            :param accept: Optional. Function that takes the rows of the trials in presentation order (the trials
+                           already run and the remaining ones) and returns False if the order must be avoided.
+                           Aborted trials are put back in the first random position accepted, or in a random
+                           position if there is none.
+            """
+            self._order = np.arange(n)
+            self.remaining = n
+            self._rng = np.random if rng is None else rng
+            self._randint = np.random.randint if rng is None else rng.integers
+            self._accept = accept
+            self._presented = []
+
+        def pop(self):
+            # Row of the next trial
+            self.remaining -= 1
+            self._presented.append(int(self._order[self.remaining]))
+            return self._presented[-1]
+
+        def requeue(self, index):
+            # Put the trial back and swap it with a random remaining trial
+            self._presented.pop()
+            slot = self._randint(self.remaining + 1)
+            if self._accept is not None:
+                for candidate in self._rng.permutation(self.remaining + 1):
+                    order = self._order[:self.remaining + 1].copy()
+                    order[self.remaining], order[candidate] = order[candidate], index
+                    if self._accept(np.concatenate((self._presented, order[::-1])).astype(int)):
+                        slot = candidate
+                        break
+            self._order[self.remaining] = self._order[slot]
+            self._order[slot] = index
+            self.remaining += 1
+
+    class constrainedShuffler:
+        def __init__(self, max_runs=None, transition_factor='congruent', transition_tolerance=3,
+                     balance_factor='stim_position', max_imbalance=4, max_restarts=100):
+            """
+            Shuffle the trials of a trialTable with constraints on the order. The order is built trial by trial,
+            every trial is drawn from the remaining trials that keep the constraints (weighted by how many trials
+            are left of their levels, so the last trials don't get stuck) and the order is started again if no
+            trial is left or the transitions aren't balanced at the end.
+
+            :param max_runs: Optional. Dictionary with the column name and maximum number of consecutive trials
+                             with the same value, e.g. {'SOA': 3, 'congruent': 4}.
+            :param transition_factor: Optional. Column whose first-order transitions (e.g. congruent after
+                                      incongruent) are balanced. None to disable (default: 'congruent').
+            :param transition_tolerance: Optional. Maximum difference between the counts of the transitions
+                                         (default: 3).
+            :param balance_factor: Optional. Column whose levels are kept balanced along the block. None to
+                                   disable (default: 'stim_position').
+            :param max_imbalance: Optional. Maximum difference between the counts of its levels at any point
+                                  of the block (default: 4).
+            :param max_restarts: Optional. Orders built before using an unconstrained shuffle (default: 100).
+            """
+            self.max_runs = {} if max_runs is None else max_runs
+            self.transition_factor = transition_factor
+            self.transition_tolerance = transition_tolerance
+            self.balance_factor = balance_factor
+            self.max_imbalance = max_imbalance
+            self.max_restarts = max_restarts
+
+        def codes(self, table):
+            # Integer codes (0 to number of levels - 1) of the constrained columns
+            names = set(self.max_runs) | {self.transition_factor, self.balance_factor}
+            return {name: np.unique(table.data[name], return_inverse=True)[1].ravel()
+                    for name in names if name is not None}
+
+        def valid_runs(self, codes, order):
+            # True if no run in the order is longer than the maximum
+            for name, max_run in self.max_runs.items():
+                values = codes[name][order]
+                changes = np.flatnonzero(np.diff(values)) + 1
+                if np.diff(np.concatenate(([0], changes, [len(values)]))).max() > max_run:
+                    return False
+            return True
+
+        def _transition_counts(self, codes, order):
+            levels = codes[self.transition_factor]
+            k = levels.max() + 1
+            values = levels[order]
+            return np.bincount(values[:-1] * k + values[1:], minlength=k * k)
+
+        def _build(self, codes, n, rng):
+            # One try of the greedy order, None if it gets stuck
+            order = np.empty(n, dtype=int)
+            remaining = np.ones(n, dtype=bool)
+            runs = {name: 0 for name in self.max_runs}
+            left = {name: np.bincount(codes[name]) for name in self.max_runs}
+            if self.transition_factor is not None:
+                t_codes = codes[self.transition_factor]
+                k = t_codes.max() + 1
+                transitions = np.zeros((k, k))
+            if self.balance_factor is not None:
+                b_codes = codes[self.balance_factor]
+                balance = np.zeros(b_codes.max() + 1)
+            for i in range(n):
+                candidates = remaining.copy()
+                # run lengths
+                for name, max_run in self.max_runs.items():
+                    if runs[name] >= max_run:
+                        candidates &= codes[name] != codes[name][order[i - 1]]
+                # balance along the block
+                if self.balance_factor is not None:
+                    after = balance + np.eye(len(balance))
+                    after = after.max(axis=1) - after.min(axis=1)
+                    candidates &= (after <= max(self.max_imbalance, np.ptp(balance)))[b_codes]
+                # least used transition from the previous trial
+                if self.transition_factor is not None and i > 0:
+                    available = np.bincount(t_codes[candidates], minlength=k) > 0
+                    counts = np.where(available, transitions[t_codes[order[i - 1]]], np.inf)
+                    candidates &= (counts == counts.min())[t_codes]
+                rows = np.flatnonzero(candidates)
+                if len(rows) == 0:
+                    return None
+                # prefer levels with more trials left
+                weights = np.ones(len(rows))
+                for name in self.max_runs:
+                    weights *= left[name][codes[name][rows]]
+                cumulative = np.cumsum(weights)
+                row = rows[min(np.searchsorted(cumulative, rng.random() * cumulative[-1], side='right'), len(rows) - 1)]
+                # update state
+                for name in self.max_runs:
+                    runs[name] = runs[name] + 1 if i > 0 and codes[name][row] == codes[name][order[i - 1]] else 1
+                    left[name][codes[name][row]] -= 1
+                if self.transition_factor is not None and i > 0:
+                    transitions[t_codes[order[i - 1]], t_codes[row]] += 1
+                if self.balance_factor is not None:
+                    balance[b_codes[row]] += 1
+                order[i] = row
+                remaining[row] = False
+            return order
+
+        def order(self, table, rng=None):
+            """
+            Order of the trials of a table (first trial first).
+
+            :param table: trialTable.
+            :param rng: Optional. numpy Generator. np.random is used if None.
+
+            :return: numpy array with the row indices.
+            """
+            rng = np.random if rng is None else rng
+            codes = self.codes(table)
+            for _ in range(self.max_restarts):
+                order = self._build(codes, len(table), rng)
+                if order is None:
+                    continue
+                if self.transition_factor is None or np.ptp(self._transition_counts(codes, order)) <= self.transition_tolerance:
+                    return order
+            warnings.warn('No trial order with the constraints was found, the trials are shuffled without constraints')
+            return rng.permutation(len(table))
+
     def create_block_trials_list(self):
         """
         Creates a list of block trials based on the given number of repetitions of unique trials.
@@ -1284,9 +2821,9 @@ class exp:
         # save unique trials
         self._mask_task_unique_trials = mask_unique_trials
 
-        # create block trial list
-        self._block_trials_mask = self._mask_task_unique_trials * 2
-        self._block_trials_prime = self._prime_task_unique_trials * 3
+        # create block trials tables
+        self._block_trials_mask = self.trialTable.from_trials(self._mask_task_unique_trials).repeat(2)
+        self._block_trials_prime = self.trialTable.from_trials(self._prime_task_unique_trials).repeat(3)
 
     def get_unique_trials(self):
 
@@ -1298,6 +2835,136 @@ class exp:
         
         return ut
 
+    class runningStats:
+        def __init__(self):
+            """
+            Count, mean and variance of a variable updated one value at a time (Welford's algorithm), so
+            the cost of every update doesn't depend on the number of values.
+            """
+            self.n = 0
+            self._mean = 0.
+            self._m2 = 0.
+
+        def add(self, x):
+            self.n += 1
+            delta = x - self._mean
+            self._mean += delta / self.n
+            self._m2 += delta * (x - self._mean)
+
+        def merge(self, other):
+            # Add the values of another runningStats (Chan et al. parallel update)
+            n = self.n + other.n
+            if other.n:
+                delta = other._mean - self._mean
+                self._mean += delta * other.n / n
+                self._m2 += other._m2 + delta ** 2 * self.n * other.n / n
+                self.n = n
+            return self
+
+        @property
+        def mean(self):
+            return self._mean if self.n else np.nan
+
+        @property
+        def variance(self):
+            return self._m2 / (self.n - 1) if self.n > 1 else np.nan
+
+        @property
+        def sd(self):
+            return np.sqrt(self.variance)
+
+    class trialStatistics:
+        keys = ('block_type', 'block', 'task', 'soa', 'congruent')
+
+        def __init__(self):
+            """
+            Running statistics of the trials of a session, with a cell per block type, block, task, SOA and
+            congruence. Every cell has a runningStats of the accuracy and one of the RT.
+            """
+            self._cells = {}
+
+        def add(self, block_type, block, task, soa, congruent, accuracy, rt=None):
+            key = (block_type, block, task, soa, congruent)
+            if key not in self._cells:
+                self._cells[key] = {'accuracy': exp.runningStats(), 'rt': exp.runningStats()}
+            self._cells[key]['accuracy'].add(accuracy)
+            if rt is not None:
+                self._cells[key]['rt'].add(rt)
+
+        def summary(self, by=(), **filters):
+            """
+            Merge the cells that match the filters.
+
+            :param by: Optional. Names of the keys to group by, e.g. ('soa', 'congruent').
+            :param filters: Values of the keys of the cells to merge, e.g. block_type='experiment', task='mask'.
+
+            :return: Dictionary with a tuple of the by values and a dictionary with the merged runningStats
+                     ('accuracy' and 'rt') of every group, sorted by the by values.
+            """
+            positions = {name: i for i, name in enumerate(self.keys)}
+            groups = {}
+            for key, cell in self._cells.items():
+                if all(key[positions[name]] == value for name, value in filters.items()):
+                    group = groups.setdefault(tuple(key[positions[name]] for name in by),
+                                              {'accuracy': exp.runningStats(), 'rt': exp.runningStats()})
+                    group['accuracy'].merge(cell['accuracy'])
+                    group['rt'].merge(cell['rt'])
+            return dict(sorted(groups.items(), key=lambda item: tuple((x is None, x) for x in item[0])))
+
+    class primingMonitor:
+        def __init__(self):
+            """
+            Live priming effects of a session, updated one trial at a time. For every SOA it keeps the RT of
+            the congruent and incongruent trials (runningStats) and the hit and false alarm counts of the prime
+            judgements, so the priming effect and the prime sensitivity (d') can be checked after every block.
+            """
+            self._rt = {}
+            self._responses = {}
+
+        def add_rt(self, soa, congruent, rt):
+            if (soa, congruent) not in self._rt:
+                self._rt[(soa, congruent)] = exp.runningStats()
+            self._rt[(soa, congruent)].add(rt)
+
+        def add_response(self, judgement, soa, signal, yes):
+            """
+            Add a prime judgement.
+
+            :param judgement: Name of the judgement, e.g. 'discrimination'.
+            :param soa: SOA of the trial.
+            :param signal: True in signal trials (e.g. prime pointing to the right).
+            :param yes: True if the answer was the signal answer (e.g. 'right').
+            """
+            # hits, signal trials, false alarms, noise trials
+            counts = self._responses.setdefault((judgement, soa), [0, 0, 0, 0])
+            counts[0 if signal else 2] += bool(yes)
+            counts[1 if signal else 3] += 1
+
+        def priming_effect(self, soa):
+            # Incongruent minus congruent mean RT (s)
+            return self._rt.get((soa, False), exp.runningStats()).mean - self._rt.get((soa, True), exp.runningStats()).mean
+
+        def d_prime(self, judgement, soa):
+            # Sensitivity with the log-linear correction, so it's finite with 0 or 100% hits
+            hits, signal, false_alarms, noise = self._responses.get((judgement, soa), [0, 0, 0, 0])
+            if not signal or not noise:
+                return np.nan
+            z = statistics.NormalDist().inv_cdf
+            return z((hits + .5) / (signal + 1)) - z((false_alarms + .5) / (noise + 1))
+
+        def summary(self):
+            # One line per SOA with the priming effect and the d' of every judgement
+            soas = sorted({soa for soa, _ in self._rt} | {soa for _, soa in self._responses})
+            judgements = sorted({judgement for judgement, _ in self._responses})
+            lines = []
+            for soa in soas:
+                congruent = self._rt.get((soa, True), exp.runningStats())
+                incongruent = self._rt.get((soa, False), exp.runningStats())
+                lines.append(f'soa {soa}: rt congruent {congruent.mean:.3f} s (n={congruent.n}), incongruent '
+                             f'{incongruent.mean:.3f} s (n={incongruent.n}), priming {self.priming_effect(soa) * 1000:+.0f} ms' +
+                             ''.join(f", {judgement} d' {self.d_prime(judgement, soa):.2f}" for judgement in judgements))
+            return lines
+
     def update_performance(self):
         """
         Update the performance counters for the current block.
@@ -1312,9 +2979,17 @@ class exp:
         elif self._this_trial_task == 'mask':
             self._mask_correct_count += self._this_trial_mask_accuracy
             self._mask_trial_count += 1
-            self._mask_rt.append(self.exp_handler.getAllEntries()[-1]['mask_rt'])
+            self._mask_rt.add(self._this_trial_mask_rt)
             self._prime_correct_count += self._this_trial_prime_accuracy
             self._prime_trial_count += 1
+        # running statistics of the session. Congruence is None in prime absent trials
+        congruent = self._this_trial_congruent if self._this_trial_prime_presence != 'absent' else None
+        if self._this_trial_task == 'prime':
+            accuracy, rt = self._this_trial_prime_accuracy, self._this_trial_prime_rt
+        else:
+            accuracy, rt = self._this_trial_mask_accuracy, self._this_trial_mask_rt
+        self._trial_stats.add(self._block_type, self._block_count, self._this_trial_task, self._this_trial_soa,
+                              congruent, accuracy, rt)
 
     def run_block(self, trials=None, task=None):
         """
@@ -1330,17 +3005,21 @@ class exp:
                 raise ValueError('task is not input and block task is not set. Please input task or set block task.')
             else:
                 task = self._block_task
-        # Trials list is input or taken from block trial list
+        # Trials table is input or taken from block trials table
         if trials is None:
             if task == 'prime':
-                trials = copy.deepcopy(self._block_trials_prime)
+                trials = self._block_trials_prime
             elif task == 'mask':
-                trials = copy.deepcopy(self._block_trials_mask)
+                trials = self._block_trials_mask
         elif isinstance(trials, int):
             if task == 'prime':
-                trials = list(np.random.choice(self._block_trials_prime, trials, replace=False))
+                trials = self._block_trials_prime.sample(trials)
             elif task == 'mask':
-                trials = list(np.random.choice(self._block_trials_mask, trials, replace=False))
+                trials = self._block_trials_mask.sample(trials)
+        elif isinstance(trials, list):
+            trials = self.trialTable.from_trials(trials)
+        # Order of the trials, the table is not modified
+        queue = trials.queue(shuffler=self._shuffler)
         
         # set block status
         self._block_running = True
@@ -1370,7 +3049,8 @@ class exp:
             self.exp_handler.addData('feedback', self._trial_feedback)
 
             # Get trial info
-            trial = trials.pop()
+            trial_index = queue.pop()
+            trial = trials.row(trial_index)
 
             # Parse trial information
             prime_direction = trial['prime_direction']
@@ -1383,7 +3063,7 @@ class exp:
                 prime_presence = 'present'
             
             # Print trial information
-            time_left = 90-round(exp_clock.getTime()/60)
+            time_left = 90-round(self._exp_clock.getTime()/60)
             progress_text =  f'{time_left} min. --- Block ({self._block_count}): {task} - Trial {self._trial_count}'
             print(progress_text)
             self.print_progress(progress_text)
@@ -1391,14 +3071,19 @@ class exp:
             # present stimuli 
             self.present_stimuli(task, prime_direction, mask_direction, stim_position, soa, prime_presence)
             
-            # if trial is aborted, append current trial 
-            # setting to trial list and shuffle list
+            # trials with dropped frames during the prime or the SOA are repeated like aborted trials
+            if self.trial_timing_error and self._requeue_timing_errors:
+                self.trial_aborted = True
+                self.exp_handler.addData('trial_aborted', self.trial_aborted)
+                warnings.warn(f'Dropped frames on trial {self._trial_count}, the trial will be repeated')
+
+            # if trial is aborted, put the trial back
+            # in a random position of the remaining trials
             if self.trial_aborted:
                 self._block_trial_count -= 1
                 self._valid_trial_count -= 1
                 counter-=1
-                trials.append(trial)
-                np.random.shuffle(trials)
+                queue.requeue(trial_index)
             else:
                 # feedback
                 self.play_feedback()
@@ -1406,7 +3091,7 @@ class exp:
                 self.update_performance()
 
             # End trial
-            self.exp_handler.nextEntry()
+            self._next_entry()
 
             # Show performance
             if counter == int(self.trials_in_block/2)-1:
@@ -1418,16 +3103,24 @@ class exp:
                     self._prime_trial_count = 0
                     self._mask_correct_count = 0
                     self._mask_trial_count = 0
-                    self._mask_rt = []
+                    self._mask_rt = self.runningStats()
+
+        # write the block trials to disk before the transition wait
+        self._sync_trial_stream()
 
         # add wait to make transition more fluid
-        core.wait(.3)
+        self._wait(.3)
 
         # set block to end
         self._block_running = False
 
     def show_performance(self, experiment_progress=None, block_trials_number=None, have_break=None):
         # Vorberg: Trials were grouped in blocks of 50–72 trials, and summary feedback 
+
+        # Block statistics and priming monitor in the progress log
+        self.print_block_statistics()
+        if self._block_type == 'experiment':
+            self.print_priming_monitor()
         # (mean RT, percentage correct) was given after each block
         """
         Show the performance of the last block.
@@ -1473,7 +3166,7 @@ class exp:
         if self._block_type == 'experiment' and self._block_task == 'mask':
             
             # check RT ------------------------------
-            last_block_rt = np.mean(self._mask_rt)
+            last_block_rt = self._mask_rt.mean
             # Print progress
             self.print_progress(f'-- average rt is {round(last_block_rt, 4)}')
             # get percentage correct
@@ -1502,10 +3195,6 @@ class exp:
         # Prime block: prime discrimination
         elif self._block_type == 'experiment' and self._block_task == 'prime':
             
-            # get last block data
-            last_block_data = self.exp_handler.getAllEntries()
-            last_block_data = last_block_data[-self._prime_trial_count:]
-            
             # get percentage correct
             last_block_prime_percentage_correct = self._prime_correct_count / self._prime_trial_count if all([self._prime_correct_count, self._prime_trial_count]) else 0
             self.print_progress(f'-- average PRIME percentage correct is {round(last_block_prime_percentage_correct, 4)}')
@@ -1515,7 +3204,7 @@ class exp:
                                 f'Prime performance: {int(last_block_prime_percentage_correct*100)}% correct.'
             
         # Performance clock
-        performance_clock = core.Clock()
+        performance_clock = self._new_clock()
         self._win.callOnFlip(performance_clock.reset)
         
         # Add break text
@@ -1530,13 +3219,12 @@ class exp:
             # draw message and wait
             perf_mssg.setAutoDraw(True)
             self._flip_it()
-            core.wait(self._forced_break_duration)
+            self._wait(self._forced_break_duration)
             # draw message off
             perf_mssg.setAutoDraw(False) 
             self._flip_it()
             # screen before starting new block
-            self.show_message(text='Press A or L when you are ready to continue.', 
-                              wait_keypress=['a', 'l'], color='black', height=self._default_text_height*.8, wrapWidth=15, block_keypress=.5)                
+            self.show_message(**self._static_messages['continue'], wait_keypress=['a', 'l'], block_keypress=.5)                
             
         else:
             # indicate a short break is possible
@@ -1561,14 +3249,14 @@ class exp:
         self.exp_handler.addData('mask_correct_trials', self._mask_correct_count)
         self.exp_handler.addData('prime_correct_trials', self._prime_correct_count)
 
-        self.exp_handler.nextEntry()
+        self._next_entry()
 
         # Reset performance counter
         self._prime_correct_count = 0
         self._prime_trial_count = 0
         self._mask_correct_count = 0
         self._mask_trial_count = 0
-        self._mask_rt = []
+        self._mask_rt = self.runningStats()
 
     def setup_total_trials(self):
         """
@@ -1608,15 +3296,16 @@ class exp:
     def _set_debugging_time(self):
         # Set frame rate to 60 because most monitors can handle it
         self._frame_rate = 60
-        # Update stimuli timing manually to values achievable by the frame rate
+        # Update stimuli timing manually to values achievable by the frame rate, so every SOA level
+        # keeps its own number of frames
         self._fixation_duration_s = (1/60) * 42
         self._default_prime_duration_s = (1/60)
         self._default_mask_duration_s = self._default_prime_duration_s * 10
         self._possible_SOAs_s = [round(self._default_prime_duration_s * x, 4) for x in range(1, 7)]
 
     def _get_n_trials(self, n):
-        # Get n trials from the block trials list
-        return self._block_trials[:n]
+        # Get n trials from the block trials table
+        return self._block_trials.head(n)
     
     def experiment_welcome(self):
         
@@ -1728,6 +3417,239 @@ class exp:
         fixation.setAutoDraw(False)
         self._flip_it()
 
+    class trialStream:
+
+        def __init__(self, file_name: str, buffer_size: int = 1024 * 1024):
+            """
+            Append-only trial file. Every finished exp_handler entry is written as one JSON line to an in-memory
+            buffer, and the buffer is only flushed and synced to disk when sync is called (at the end of every
+            block), so disk latency never lands inside a trial. If the session crashes, all the synced trials
+            are in the file.
+
+            :param file_name: Path to the trial stream file.
+            :param buffer_size: Size (bytes) of the write buffer.
+            """
+            self.file_name = file_name
+            self._file = open(file_name, 'a', buffering=buffer_size)
+            # Column names in the order they were first seen
+            self._columns = {}
+
+        @staticmethod
+        def _to_json(value):
+            # numpy values are written as python values
+            if hasattr(value, 'item'):
+                return value.item()
+            return str(value)
+
+        def write(self, entry: dict):
+            """
+            Write a finished entry. This only touches the write buffer.
+
+            :param entry: Entry as stored by exp_handler.
+            """
+            if self._file is None:
+                warnings.warn('Trial stream is closed, entry not written')
+                return
+            self._columns.update(dict.fromkeys(entry))
+            self._file.write(json.dumps(entry, default=self._to_json) + '\n')
+
+        def sync(self):
+            # Flush the buffer and make sure the data is on disk
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+        def close(self):
+            # Sync and close the file
+            if self._file is not None:
+                self.sync()
+                self._file.close()
+                self._file = None
+
+        def read_entries(self):
+            # Read all the entries in the stream file
+            with open(self.file_name) as stream_file:
+                return [json.loads(line) for line in stream_file if line.strip()]
+
+        def to_csv_text(self, extra_info_names=None, extra_entries=None):
+            """
+            Build a wide CSV of the session from the stream file (None is written as 'None'), e.g. to recover
+            the trials of a session that crashed. This is not the session csv: exp_handler.saveAsWideText is the
+            canonical format and adds the columns psychopy fills when saving (e.g. thisRow.t and notes), its
+            own column order and a UTF-8 BOM.
+
+            :param extra_info_names: Optional. Columns to put last (the exp_handler extraInfo keys).
+            :param extra_entries: Optional. Entries that are not in the stream yet (e.g. the last unfinished entry).
+
+            :return: CSV text.
+            """
+            self.sync()
+            entries = self.read_entries() + list(extra_entries or [])
+
+            # Columns in the order they were first seen, extra info columns last
+            columns = dict(self._columns)
+            for entry in entries:
+                columns.update(dict.fromkeys(entry))
+            extra_info_names = [x for x in (extra_info_names or []) if x in columns]
+            columns = [x for x in columns if x not in extra_info_names] + extra_info_names
+
+            # Write rows
+            csv_text = io.StringIO()
+            writer = csv.writer(csv_text, lineterminator='\n')
+            writer.writerow(columns)
+            for entry in entries:
+                writer.writerow([('None' if entry[x] is None else entry[x]) if x in entry else '' for x in columns])
+
+            return csv_text.getvalue()
+
+    def setup_trial_stream(self):
+        # Stream finished entries to an append-only file next to the data file
+        try:
+            if not os.path.isdir(os.path.dirname(self._filename_full_path)):
+                os.makedirs(os.path.dirname(self._filename_full_path))
+            self._trial_stream = self.trialStream(self._filename_full_path + '_trials.jsonl')
+        except Exception as e:
+            self._trial_stream = None
+            warnings.warn(f'Failed to open trial stream file: {e}')
+
+    def _next_entry(self):
+        # Finish the current exp_handler entry and write it to the trial stream
+        self.exp_handler.nextEntry()
+        if self._trial_stream is not None:
+            self._trial_stream.write(self.exp_handler.entries[-1])
+        self._monitor_entry(self.exp_handler.entries[-1])
+
+    def _monitor_entry(self, entry):
+        # Feed the valid experiment trials to the priming monitor: mask RTs (prime present), prime detection
+        # in mask trials and prime discrimination in prime trials
+        if entry.get('trial_type') != 'decision' or entry.get('block_type') != 'experiment' or entry.get('trial_aborted'):
+            return
+        if entry['task'] == 'mask':
+            if entry['prime_presence'] == 'present' and entry['mask_rt'] is not None:
+                self._priming_monitor.add_rt(entry['soa'], entry['congruent'], entry['mask_rt'])
+            self._priming_monitor.add_response('detection', entry['soa'], entry['prime_presence'] == 'present',
+                                               entry['prime_answer'] == 'present')
+        elif entry['task'] == 'prime':
+            self._priming_monitor.add_response('discrimination', entry['soa'], entry['prime_direction'] == 'right',
+                                               entry['prime_answer'] == 'right')
+
+    def _sync_trial_stream(self):
+        # Make sure all the finished entries are on disk
+        if self._trial_stream is not None:
+            try:
+                self._trial_stream.sync()
+            except Exception as e:
+                warnings.warn(f'Failed to sync trial stream file: {e}')
+
+    def _close_trial_stream(self):
+        # Sync and close the trial stream
+        if self._trial_stream is not None:
+            try:
+                self._trial_stream.close()
+            except Exception as e:
+                warnings.warn(f'Failed to close trial stream file: {e}')
+
+    class progressLog:
+
+        def __init__(self, file_name: str, history_file_name: str = None, max_view_lines: int = 200):
+            """
+            Progress log written by a background thread so no disk access happens between trials. Every line is
+            appended to a history file (constant time per line) and the newest lines are kept in a bounded
+            newest-first view that the researcher can follow during the session.
+
+            :param file_name: File with the newest-first view of the progress log.
+            :param history_file_name: Append-only file with all the lines in chronological order. Defaults to
+                                        file_name with the '_history' suffix.
+            :param max_view_lines: Number of lines kept in the newest-first view.
+            """
+            if history_file_name is None:
+                history_file_name = os.path.splitext(file_name)[0] + '_history.log'
+
+            # Save inputs
+            self.file_name = file_name
+            self.history_file_name = history_file_name
+            self.max_view_lines = max_view_lines
+
+            # Newest lines for the view file, oldest are dropped automatically
+            self._view_lines = collections.deque(maxlen=max_view_lines)
+            # Lines waiting to be written
+            self._queue = queue.Queue()
+            self._closed = False
+
+            # Create (or empty) both files
+            for name in [self.file_name, self.history_file_name]:
+                with open(name, 'w'):
+                    pass
+
+            # Start writer
+            self._writer = threading.Thread(target=self._write_loop, name='progress_log_writer', daemon=True)
+            self._writer.start()
+
+        def write(self, line: str):
+            """
+            Queue a line to be written. This never touches the disk.
+
+            :param line: Text to log.
+            """
+            if not self._closed:
+                self._queue.put(line)
+
+        def close(self, timeout: float = 5):
+            """
+            Write all the queued lines and stop the writer thread.
+
+            :param timeout: Maximum time (s) to wait for the writer to finish.
+            """
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+                self._writer.join(timeout=timeout)
+
+        def _write_loop(self):
+            history_file = open(self.history_file_name, 'a')
+            try:
+                while True:
+                    line = self._queue.get()
+                    # None is the signal to stop
+                    if line is None:
+                        break
+                    try:
+                        history_file.write(f'{line}\n')
+                        self._view_lines.appendleft(line)
+                        # Only update the disk when the queue is empty. Bursts of lines are written together
+                        if self._queue.empty():
+                            history_file.flush()
+                            self._write_view()
+                    except Exception as e:
+                        warnings.warn(f'Failed to write to progress log file: {e}')
+            finally:
+                history_file.flush()
+                history_file.close()
+                self._write_view()
+
+        def _write_view(self):
+            # The view is bounded so rewriting it takes constant time
+            try:
+                with open(self.file_name, 'w') as view_file:
+                    view_file.writelines(f'{line}\n' for line in self._view_lines)
+            except Exception as e:
+                warnings.warn(f'Failed to write to progress log file: {e}')
+
+    def print_block_statistics(self):
+        # Accuracy and RT per SOA of the current block in the progress log
+        for (soa,), cell in self._trial_stats.summary(by=('soa',), block_type=self._block_type,
+                                                      block=self._block_count, task=self._block_task).items():
+            self.print_progress(f'-- soa {soa}: {cell["accuracy"].n} trials, {cell["accuracy"].mean:.0%} correct, '
+                                f'rt {cell["rt"].mean:.3f} s (sd {cell["rt"].sd:.3f})')
+
+    def print_priming_monitor(self):
+        # Priming effect and prime d' per SOA so far, in the console and the progress log
+        lines = self._priming_monitor.summary()
+        if lines:
+            print('\n'.join(['Priming monitor:'] + lines))
+            for line in lines:
+                self.print_progress(f'-- {line}')
+
     def setup_progress_log(self):
         # path to progress log folder 
         self._progress_folder = os.path.join(self._this_dir, 'log')
@@ -1738,25 +3660,24 @@ class exp:
         # create file
         self._log_file_name = os.path.join(self._progress_folder, f'{self._experiment_info["participant"]}_progress.log')
 
-        # try to open file, if not throw a warning
+        # try to start progress log, if not throw a warning
         try:
-            progress_log = open(self._log_file_name, 'w')
-            progress_log.close()
+            self._progress_log = self.progressLog(self._log_file_name)
         except Exception as e:
+                self._progress_log = None
                 warnings.warn(f'Failed to open progress log file: {e}')
 
+    def close_progress_log(self):
+        # write pending lines and stop the progress log writer
+        if self._progress_log is not None:
+            self._progress_log.close()
+
     def print_progress(self, text):
         try:
             # compose log text
             new_line = f"{self._experiment_info['participant']} {self._experiment_info['cubicle']}: {text} "
-            # open and read file
-            progress_log = open(self._log_file_name)
-            old_lines = progress_log.read()
-            # open and write new and old lines
-            progress_log = open(self._log_file_name, 'w')
-            progress_log.writelines((f'{new_line}\n', old_lines))
-            progress_log.flush()
-            progress_log.close()
+            # queue line, the progress log writes it in the background
+            self._progress_log.write(new_line)
         except Exception as e:
                 warnings.warn(f'Failed to write to progress log file: {e}')
 
@@ -1785,7 +3706,7 @@ class exp:
             wrapWidth=25
         )
 
-        core.wait(.1)
+        self._wait(.1)
 
         # --- Instructions for the mask-prime task --- 
        
@@ -1842,7 +3763,7 @@ class exp:
         second_arrow_label.setAutoDraw(False)
         self._flip_it()
 
-        core.wait(.1)
+        self._wait(.1)
 
         # ------------------
 
@@ -1871,7 +3792,7 @@ class exp:
         fixation.setAutoDraw(False)
         self._flip_it()
 
-        core.wait(.1)
+        self._wait(.1)
 
                 # ------------------
 
@@ -1887,7 +3808,7 @@ class exp:
         fixation.setAutoDraw(False)
         self._flip_it()
 
-        core.wait(.1)
+        self._wait(.1)
 
     def prime_instructions(self):
         
@@ -1962,7 +3883,7 @@ class exp:
         # Draw examples off and flip screen
         self._flip_it()
 
-        core.wait(.1)
+        self._wait(.1)
 
         # ------------------
 
@@ -1992,7 +3913,7 @@ class exp:
         fixation.setAutoDraw(False)
         self._flip_it()
 
-        core.wait(.1)
+        self._wait(.1)
 
         # ------------------
 
@@ -2014,7 +3935,7 @@ class exp:
         fixation.setAutoDraw(False)
         self._flip_it()
 
-        core.wait(.1)
+        self._wait(.1)
 
 if __name__ == '__main__':
     '''
@@ -2027,8 +3948,11 @@ if __name__ == '__main__':
     e = exp()
     e.start_exp_handler(exp_info={'frame_rate': 60, 'participant': 999, 'blocks_to_run': 6})
     
-    # Apply frame rate to timing
+    # Use durations a 60 Hz monitor can show. Without this the 240 Hz durations are rounded to 60 Hz
+    # frames by calibrate_refresh and some SOA levels end up with the same number of frames
     e._set_debugging_time()
+    
+    # Apply frame rate to timing
     e.update_timing()
     
     # create trials
@@ -2039,6 +3963,8 @@ if __name__ == '__main__':
 
     # open window
     e.open_window(monitor='nostromo', full_screen=True, size=[2560, 1440])
+    # measure the monitor and check the debugging timing plan against it
+    e.calibrate_refresh(strict=False)
      
     # demographics
     e.run_demographic_questions()
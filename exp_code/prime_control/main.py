@@ -26,6 +26,8 @@ def run_experiment(experiment_info):
     
     # open window
     e.open_window(monitor='vu', full_screen=True, screen_index=0)
+    # Measure the monitor and check the timing
+    e.calibrate_refresh()
     
     # Adjust chin-rest
     e.adjust_chinrest()
@@ -82,6 +84,7 @@ def run_experiment(experiment_info):
 
     # The experiment is over
     e.print_progress(f'Experiment done!')
+    e.close_progress_log()
     e.show_message(text='The experiment is over. Thanks for participating! The researcher will be with you shortly.',
                    color='black', height=e._default_text_height * .9, wait_keypress=['space'])
     
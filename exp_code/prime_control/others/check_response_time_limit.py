@@ -8,7 +8,6 @@ e = exp()
 e.start_exp_handler(exp_info={'frame_rate': 240, 'participant': 999, 'session': 999, 'blocks_to_run': 2})
 
 # Apply frame rate to timing
-# e._set_debugging_time()
 e.update_timing()
 
 # create trials
@@ -19,6 +18,8 @@ print('exp started...')
 
 # open window
 e.open_window(monitor='vu', full_screen=True)
+# measure the monitor and check the timing
+e.calibrate_refresh()
 
 # simulate 
 e._simulate_keys(True)
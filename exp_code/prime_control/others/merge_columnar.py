@@ -0,0 +1,79 @@
+"""
+~~ merge columnar session files
+
+this script merges the typed columnar files (.npz) that exp.save_csv writes for every session into a
+single raw_control dataset, keeping only the experiment trials and the columns of data/raw_control.csv.
+the merged dataset keeps the column types (booleans, float seconds and categorical directions), so it
+loads faster than the csv and doesn't need to parse values like TRUE/True.
+
+usage (from the prime_control folder):
+    python others/merge_columnar.py --input data --output raw_control.npz
+
+"""
+
+import os
+import sys
+import glob
+import argparse
+
+# Make exp.py importable when running the script from any folder
+_expDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _expDir not in sys.path:
+    sys.path.insert(0, _expDir)
+
+from exp import exp
+import pandas as pd
+
+# Columns in data/raw_control.csv
+raw_columns = ['participant', 'block_count', 'trial_count', 'trial_aborted', 'soa', 'congruent', 'task',
+               'prime_presence', 'prime_direction', 'mask_direction', 'stim_position', 'mask_answer', 'mask_rt',
+               'prime_answer', 'prime_rt', 'mask_accuracy', 'prime_accuracy']
+# Columns that are integers once the non-trial rows are removed
+int_columns = ['block_count', 'trial_count']
+
+
+def merge_sessions(file_names):
+    """
+    Merge the experiment trials of the session columnar files.
+
+    :param file_names: List of session .npz files.
+
+    :return: pandas.DataFrame with the merged trials.
+    """
+    sessions = []
+    for file_name in file_names:
+        session_data = exp.columnarTable.to_dataframe(file_name)
+        # keep experiment trials only
+        session_data = session_data[(session_data['block_type'] == 'experiment') &
+                                    (session_data['trial_type'] == 'decision')]
+        sessions.append(session_data[raw_columns])
+    merged = pd.concat(sessions, ignore_index=True)
+    merged[int_columns] = merged[int_columns].astype(int)
+
+    return merged
+
+
+def save_merged(merged, file_name):
+    # Save as parquet (needs pyarrow) or as a columnar .npz file
+    if file_name.endswith('.parquet'):
+        merged.to_parquet(file_name, index=False)
+    else:
+        # missing values as None so the columns get their types back
+        columns = merged.astype(object).where(merged.notna(), None).to_dict('list')
+        exp.columnarTable.save(file_name, exp.columnarTable.encode(columns))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Merge session columnar files into a raw_control dataset.')
+    parser.add_argument('--input', default=os.path.join(_expDir, 'data'), help='Folder with the session .npz files.')
+    parser.add_argument('--output', default=os.path.join(_expDir, 'data', 'raw_control.npz'),
+                        help='Merged file (.npz or .parquet).')
+    args = parser.parse_args()
+
+    # Session files, the merged file is not a session
+    file_names = sorted(x for x in glob.glob(os.path.join(args.input, 'data_*.npz')))
+    merged = merge_sessions(file_names)
+    save_merged(merged, args.output)
+
+    print(f'Merged {len(file_names)} sessions ({len(merged)} trials) into {args.output}')
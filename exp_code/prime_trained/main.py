@@ -15,14 +15,32 @@ def run_experiment(experiment_info):
     # Initialize experiment
     e = exp()
     e.start_exp_handler(exp_info=experiment_info)
+
+    # Run session
+    run_session(e, experiment_info)
+
+    # Save data
+    e.win.close()
+    e.save_csv()
+    e.exp_handler.abort()
+    core.quit()
+
+def run_session(e, experiment_info):
+    # Runs the whole session with an experiment whose exp handler is already started.
+    # This is also used by others/simulate_sessions.py with a headless experiment.
+
     # Set up trials    
     e.create_block_trials_list(repeat_unique_trials=2)
     e.setup_total_trials()    
+    # Load or generate the trial order of the session
+    e.setup_schedule()
 
     # Update timing
     e.update_timing()
     # open window
     e.open_window(monitor='vu', full_screen=True, screen_index=0)
+    # Measure the monitor and check the timing
+    e.calibrate_refresh()
     
     # Adjust chin-rest
     e.adjust_chinrest()
@@ -47,7 +65,7 @@ def run_experiment(experiment_info):
     # Blocked task instructions
     e.show_message(text='The experiment is divided into blocks. In each block you will be asked to identify the direction of the first or second arrow. You will be informed of the task at the beginning of each block. Press SPACE to continue.',
                    color='black', height=e._default_text_height * .9, wait_keypress=['space'])
-    core.wait(.1)
+    e._wait(.1)
 
     # Warm up
     if experiment_info['warm_up']:
@@ -77,14 +95,9 @@ def run_experiment(experiment_info):
 
     # The experiment is over
     e.print_progress(f'Experiment done!')
+    e.close_progress_log()
     e.show_message(text='The experiment is over. Thanks for participating! The researcher will be with you shortly.',
                    color='black', height=e._default_text_height * .9, wait_keypress=['space'])
-    
-    # Save data
-    e.win.close()
-    e.save_csv()
-    e.exp_handler.abort()
-    core.quit()
 
 if __name__ == '__main__':
         
@@ -0,0 +1,97 @@
+"""
+~~ session schedules
+
+this script precomputes the trial order (block tasks, per-block shuffles and warm-up trials) of
+participants x sessions and saves it to schedules/schedule_<participant>_<session>.npz. main.py loads the
+schedule of the session at startup, so the sessions can be checked before they are run and replayed
+afterwards. the blocks are shuffled with the order constraints of the experiment (exp._shuffler) and the
+balance of every schedule (trials per task, soa and congruence, longest runs) is printed.
+
+usage (from the prime_trained folder):
+    python others/make_schedules.py --participants 6 --sessions 6 --seed 1
+
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+# Make exp.py importable when running the script from any folder
+_expDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _expDir not in sys.path:
+    sys.path.insert(0, _expDir)
+
+from exp import exp
+
+
+def counterbalanced_first_task(participant, session):
+    # First task alternates across participants and sessions, as in the collected data
+    return ['prime', 'mask'][(participant + session) % 2]
+
+
+def make_schedules(participants, sessions, output_folder, seed=None, blocks_to_run=12, repeat_unique_trials=2):
+    """
+    Generate and save the schedules of all the participant x session combinations.
+
+    :param participants: List of participant numbers.
+    :param sessions: List of session numbers.
+    :param output_folder: Folder where the schedules are saved.
+    :param seed: Optional. Seed used to derive the seed of every session. A random seed is used if None.
+    :param blocks_to_run: Optional. Experiment blocks per session (default: 12).
+    :param repeat_unique_trials: Optional. Repetitions of the unique trials in a block (default: 2, as main.py).
+
+    :return: pandas.DataFrame with the trials of all the schedules in presentation order.
+    """
+    # Create output folder
+    if not os.path.isdir(output_folder):
+        os.makedirs(output_folder)
+
+    # Block trials as in main.py
+    e = exp()
+    e.create_block_trials_list(repeat_unique_trials=repeat_unique_trials)
+
+    # Independent seed for every session
+    jobs = [(p, s) for p in participants for s in sessions]
+    seeds = [int(x.generate_state(1)[0]) for x in np.random.SeedSequence(seed).spawn(len(jobs))]
+
+    rows = []
+    for (p, s), job_seed in zip(jobs, seeds):
+        first_task = counterbalanced_first_task(p, s)
+        tasks = [first_task] + [x for x in e._tasks if x != first_task]
+        schedule = e.sessionSchedule.generate(e._block_trials, tasks, blocks_to_run, seed=job_seed,
+                                              shuffler=e._shuffler)
+        schedule.save(os.path.join(output_folder, f'schedule_{str(p).zfill(3)}_{str(s).zfill(2)}.npz'))
+        rows += [{'participant': p, 'session': s, 'seed': job_seed, **row} for row in schedule.to_rows()]
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Precompute the trial order of prime_trained sessions.')
+    parser.add_argument('--participants', type=int, default=6, help='Number of participants.')
+    parser.add_argument('--sessions', type=int, default=6, help='Number of sessions per participant.')
+    parser.add_argument('--blocks', type=int, default=12, help='Blocks per session.')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for all the schedules.')
+    parser.add_argument('--output', default=os.path.join(_expDir, 'schedules'), help='Output folder.')
+    args = parser.parse_args()
+
+    schedules = make_schedules(participants=list(range(1, args.participants + 1)),
+                               sessions=list(range(1, args.sessions + 1)),
+                               output_folder=args.output, seed=args.seed, blocks_to_run=args.blocks)
+
+    # Balance of the experiment blocks
+    experiment = schedules[schedules['block_type'] == 'experiment']
+    print('\n########################################')
+    print('First task per participant and session\n')
+    print(experiment.groupby(['participant', 'session'])['task'].first().unstack())
+    print('\nTrials per task, SOA and congruence (min - max across sessions)\n')
+    counts = experiment.groupby(['participant', 'session', 'task', 'SOA', 'congruent']).size()
+    print(counts.groupby(['task', 'SOA', 'congruent']).agg(['min', 'max']).unstack())
+    print('\nLongest run of the same value\n')
+    blocks = experiment.groupby(['participant', 'session', 'block'])
+    print(pd.Series({name: blocks[name].apply(lambda x: x.ne(x.shift()).cumsum().value_counts().max()).max()
+                     for name in ['SOA', 'congruent', 'stim_position']}).to_string())
+    print('########################################')
@@ -0,0 +1,213 @@
+"""
+~~ monte carlo session simulator
+
+this script simulates participants x sessions of the run_experiment flow (main.py) with a headless
+experiment. sessions run in parallel on a process pool, every session gets its own seed and writes its
+own csv file (and its data and log folders) in the output folder, and the experiment trials of all the sessions are merged in a table with the same columns
+as data/raw_train.csv. use it to check counterbalancing and trial counts before each data wave.
+
+usage (from the prime_trained folder):
+    python others/simulate_sessions.py --participants 6 --sessions 6
+
+add --instructions to also run the instruction and practice blocks (smoke run of the whole session flow):
+    python others/simulate_sessions.py --participants 1 --sessions 1 --blocks 2 --instructions
+
+"""
+
+import os
+import sys
+import random
+import argparse
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+# Make exp.py and main.py importable when running the script from any folder
+_expDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _expDir not in sys.path:
+    sys.path.insert(0, _expDir)
+
+# Columns in data/raw_train.csv
+raw_train_columns = ['participant', 'session', 'trial_count', 'trial_aborted', 'soa', 'congruent', 'task',
+                     'prime_direction', 'mask_direction', 'stim_position', 'answer', 'rt', 'accuracy']
+
+
+def counterbalanced_first_task(participant, session):
+    # First task alternates across participants and sessions, as in the collected data
+    return ['prime', 'mask'][(participant + session) % 2]
+
+
+def make_observer(e, observer):
+    # Simulated observer by name
+    if observer == 'random':
+        return None
+    elif observer == 'psychometric':
+        return e.psychometricObserver()
+    elif observer == 'priming':
+        return e.primingObserver()
+    else:
+        raise ValueError(f'Unknown observer: {observer}')
+
+
+def simulate_session(participant, session, seed, output_folder, configuration=None, observer='priming'):
+    """
+    Simulate one session with a headless experiment and save its data.
+
+    :param participant: Participant number.
+    :param session: Session number.
+    :param seed: Seed for the random generators of this session.
+    :param output_folder: Folder where the session csv file is saved.
+    :param configuration: Optional. Dictionary with experiment_info values that override the defaults
+                          (e.g. {'blocks_to_run': 6}).
+    :param observer: Optional. Simulated observer: 'random', 'psychometric' or 'priming'.
+
+    :return: Path to the session csv file.
+    """
+    # Import here so every worker process sets up its own experiment module
+    from exp import exp
+    from main import run_session
+
+    # Every worker has its own seeded generators
+    np.random.seed(seed)
+    random.seed(seed)
+
+    # Same settings as get_experiment_info, instructions are not simulated unless configuration enables them
+    experiment_info = {'participant': participant,
+                       'session': session,
+                       'first_task': counterbalanced_first_task(participant, session),
+                       'blocks_to_run': 12,
+                       'frame_rate': 240,
+                       'cubicle': 'simulation',
+                       'something_else': False,
+                       'demographics': False,
+                       'prime_instructions': False,
+                       'mask_instructions': False,
+                       'warm_up': session > 1}
+    if configuration is not None:
+        experiment_info.update(configuration)
+    experiment_info['seed'] = seed
+
+    # Run headless session. Data, trial stream and progress log go to the output folder, so simulated
+    # participants never overwrite or mix with the files of real sessions
+    e = exp()
+    e._this_dir = output_folder
+    e._set_headless(True)
+    e._set_observer(make_observer(e, observer))
+    e.start_exp_handler(exp_info=experiment_info)
+    run_session(e, experiment_info)
+
+    # Save session data
+    file_name = os.path.join(output_folder, f'sim_{str(participant).zfill(3)}_{str(session).zfill(2)}.csv')
+    e.exp_handler.saveAsWideText(file_name)
+    e.exp_handler.abort()
+    e._close_trial_stream()
+
+    return file_name
+
+
+def merge_sessions(file_names):
+    """
+    Merge the experiment trials of the simulated sessions in a table like data/raw_train.csv.
+
+    :param file_names: List of session csv files.
+
+    :return: pandas.DataFrame with the merged trials.
+    """
+    if not file_names:
+        raise ValueError('No session files to merge')
+
+    sessions = []
+    for file_name in file_names:
+        session_data = pd.read_csv(file_name, dtype={'participant': str, 'session': str})
+        # keep experiment trials only
+        session_data = session_data[(session_data['block_type'] == 'experiment') &
+                                    (session_data['trial_type'] == 'decision')].copy()
+        session_data['trial_aborted'] = session_data['trial_aborted'].astype(bool)
+        session_data['trial_count'] = session_data['trial_count'].astype(int)
+        sessions.append(session_data[raw_train_columns])
+
+    return pd.concat(sessions, ignore_index=True)
+
+
+def simulate_sessions(participants, sessions, output_folder, seed=None, configuration=None, observer='priming',
+                      max_workers=None):
+    """
+    Simulate all the participant x session combinations in parallel.
+
+    :param participants: List of participant numbers.
+    :param sessions: List of session numbers.
+    :param output_folder: Folder where the session files and the merged table are saved.
+    :param seed: Optional. Seed used to derive the seed of every session. A random seed is used if None.
+    :param configuration: Optional. Dictionary with experiment_info values that override the defaults.
+    :param observer: Optional. Simulated observer: 'random', 'psychometric' or 'priming'.
+    :param max_workers: Optional. Number of processes. Defaults to the number of processors.
+
+    :return: pandas.DataFrame with the merged trials.
+    """
+    # Create output folder
+    if not os.path.isdir(output_folder):
+        os.makedirs(output_folder)
+
+    # Independent seed for every session
+    jobs = [(p, s) for p in participants for s in sessions]
+    seeds = [int(x.generate_state(1)[0]) for x in np.random.SeedSequence(seed).spawn(len(jobs))]
+
+    # Run sessions
+    file_names = []
+    errors = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(simulate_session, p, s, job_seed, output_folder, configuration, observer): (p, s)
+                   for (p, s), job_seed in zip(jobs, seeds)}
+        for future in concurrent.futures.as_completed(futures):
+            p, s = futures[future]
+            try:
+                file_names.append(future.result())
+                print(f'Participant {p} session {s} done')
+            except Exception as e:
+                errors[(p, s)] = e
+                print(f'Participant {p} session {s} failed: {e}')
+
+    # Without any finished session there is nothing to merge, report why the sessions failed
+    if not file_names:
+        raise RuntimeError('All the simulated sessions failed:\n' +
+                           '\n'.join(f'participant {p} session {s}: {e!r}' for (p, s), e in errors.items()))
+
+    # Merge sessions in the same order as the collected data
+    merged = merge_sessions(sorted(file_names))
+    merged.to_csv(os.path.join(output_folder, 'simulated_train.csv'), index=False)
+
+    return merged
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Simulate prime_trained sessions with a headless experiment.')
+    parser.add_argument('--participants', type=int, default=6, help='Number of participants.')
+    parser.add_argument('--sessions', type=int, default=6, help='Number of sessions per participant.')
+    parser.add_argument('--blocks', type=int, default=12, help='Blocks per session.')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the whole simulation.')
+    parser.add_argument('--observer', default='priming', choices=['random', 'psychometric', 'priming'],
+                        help='Simulated observer.')
+    parser.add_argument('--instructions', action='store_true',
+                        help='Run the instruction and practice blocks too.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes.')
+    parser.add_argument('--output', default=os.path.join(_expDir, 'data', 'simulated'), help='Output folder.')
+    args = parser.parse_args()
+
+    configuration = {'blocks_to_run': args.blocks}
+    if args.instructions:
+        configuration.update({'prime_instructions': True, 'mask_instructions': True})
+
+    merged = simulate_sessions(participants=list(range(1, args.participants + 1)),
+                               sessions=list(range(1, args.sessions + 1)),
+                               output_folder=args.output, seed=args.seed,
+                               configuration=configuration, observer=args.observer,
+                               max_workers=args.workers)
+
+    # Counterbalancing and trial counts
+    print('\n########################################')
+    print('First task per participant and session\n')
+    print(merged.groupby(['participant', 'session'])['task'].first().unstack())
+    print('\nValid trials per participant, session and task\n')
+    print(merged[~merged['trial_aborted']].groupby(['participant', 'session', 'task']).size().unstack())
+    print('########################################')
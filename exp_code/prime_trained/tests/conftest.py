@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+# Make exp.py importable when running pytest from any folder
+_expDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _expDir not in sys.path:
+    sys.path.insert(0, _expDir)
+
+
+@pytest.fixture
+def headless_exp(tmp_path):
+    # Headless experiment with its exp handler started. Data, trial stream and progress log go to tmp_path
+    from exp import exp
+
+    os.makedirs(tmp_path / 'data')
+    e = exp()
+    e._this_dir = str(tmp_path)
+    e._set_headless(True)
+    e.start_exp_handler(exp_info={'participant': 999, 'session': 1, 'first_task': 'prime', 'blocks_to_run': 2,
+                                  'frame_rate': 240, 'seed': 1})
+    e.create_block_trials_list(repeat_unique_trials=2)
+    e.setup_total_trials()
+    e.update_timing()
+    e.open_window()
+    yield e
+    e.exp_handler.abort()
+    e._close_trial_stream()
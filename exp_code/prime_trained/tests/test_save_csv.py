@@ -0,0 +1,21 @@
+def test_save_csv_matches_save_as_wide_text(headless_exp, tmp_path, monkeypatch):
+    e = headless_exp
+    # The local destination is a relative path outside windows
+    monkeypatch.chdir(tmp_path)
+
+    # Run a short block
+    e._trial_count = -1
+    e._valid_trial_count = -1
+    e.reset_block()
+    e._block_task = 'mask'
+    e._block_type = 'experiment'
+    e.run_block(trials=4)
+
+    e.save_csv()
+    e.exp_handler.saveAsWideText(str(tmp_path / 'reference.csv'))
+
+    with open(e._filename_full_path + '.csv', 'rb') as csv_file:
+        saved = csv_file.read()
+    with open(tmp_path / 'reference.csv', 'rb') as csv_file:
+        reference = csv_file.read()
+    assert saved == reference
@@ -0,0 +1,15 @@
+def test_practice_trials_are_shuffled(headless_exp):
+    e = headless_exp
+    # Order in which the block trials are generated
+    generated = e.create_block_trials_list(repeat_unique_trials=2, return_list=True)[:30]
+
+    # Practice blocks run with a session schedule loaded, but they are not scheduled
+    e.setup_schedule()
+    e.reset_block()
+    first = list(e._get_n_trials(30))
+    second = list(e._get_n_trials(30))
+
+    assert len(first) == 30
+    assert first != generated
+    # a repeated practice block gets a new order
+    assert first != second